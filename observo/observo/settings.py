@@ -218,9 +218,42 @@ EMAIL_PORT = env("EMAIL_PORT", default=587)
 EMAIL_USE_TLS = env.bool("EMAIL_USE_TLS", default=True)
 EMAIL_USE_SSL = env.bool("EMAIL_USE_SSL", default=False)
 
+# Grants API used by the `sync` command: a paginated JSON listing answering `GET ?page=&page_size=&modified_since=`
+# (see `opportunity.services.sync.GrantsClient`). There is no default, as no public API is known to follow it.
+GRANTS_API_URL = env("GRANTS_API_URL", default=None)
+GRANTS_API_KEY = env("GRANTS_API_KEY", default=None)
+
 # LLM
 GEMINI_API_KEY = env("GEMINI_API_KEY", default=None)
 
+# Embeddings: dotted path to a callable returning a LangChain `Embeddings`. `utils.embeddings.hashing_backend` runs
+# locally without network access (optionally with IDF weights saved by `HashingEmbeddings.save()`).
+EMBEDDING_BACKEND = env("EMBEDDING_BACKEND", default="utils.embeddings.gemini_backend")
+EMBEDDING_HASHING_IDF = env("EMBEDDING_HASHING_IDF", default=None)
+EMBEDDING_DIMENSIONS = 768
+EMBEDDING_CACHE_MAX_ENTRIES = env.int("EMBEDDING_CACHE_MAX_ENTRIES", default=1_000_000)
+# Query (website summary) embeddings: per-process LRU size and lifetime in the shared `embeddings` cache
+QUERY_EMBEDDING_CACHE_SIZE = env.int("QUERY_EMBEDDING_CACHE_SIZE", default=1024)
+QUERY_EMBEDDING_CACHE_TIMEOUT = env.int("QUERY_EMBEDDING_CACHE_TIMEOUT", default=7 * 24 * 60 * 60)  # 7 days
+
+# Retrieval of `match_proposals`: "vector" (MMR over the nearest chunks), "hybrid" (full-text and vector search
+# merged by reciprocal rank fusion) or "adaptive" (nearest Grants, searching more chunks only while some are missing,
+# up to MATCH_MAX_K)
+MATCH_RETRIEVAL = env("MATCH_RETRIEVAL", default="vector")
+MATCH_MAX_K = env.int("MATCH_MAX_K", default=1000)
+
+# Vector index scan tuning for `match_proposals` (see the `vector_index` command)
+VECTOR_EF_SEARCH = env.int("VECTOR_EF_SEARCH", default=100)
+VECTOR_PROBES = env.int("VECTOR_PROBES", default=10)
+# Filtered scans (open or funded Grants only) go on past `ef_search`/`probes` rows until enough rows pass the filters:
+# "relaxed_order", "strict_order" (HNSW only) or "off"; ignored before pgvector 0.8
+VECTOR_ITERATIVE_SCAN = env("VECTOR_ITERATIVE_SCAN", default="relaxed_order")
+# Precision of the candidate search: "full", "half" (halfvec) or "binary" (binary quantized). Reduced precisions need
+# the index built for them (`vector_index rebuild --precision ...`); their top `k * VECTOR_RERANK_FACTOR` candidates
+# are rescored with the stored full-precision vectors.
+VECTOR_PRECISION = env("VECTOR_PRECISION", default="full")
+VECTOR_RERANK_FACTOR = env.int("VECTOR_RERANK_FACTOR", default=4)
+
 # Celery Configuration
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TIME_LIMIT = 5 * 60 * 60  # 5 hours
@@ -243,6 +276,10 @@ CELERY_TASK_ROUTES = {
     # App: Analytics
     "notify_contact": {"queue": "fast"},
     "notify_new_survey": {"queue": "fast"},
+    # App: Opportunity
+    "vectorize_grants": {"queue": "slow"},
+    "vectorize_shard": {"queue": "slow"},
+    "finish_vectorization": {"queue": "slow"},
     # App: Search
     "auto_prepare_outline_for_website": {"queue": "slow"},
     "prepare_outline": {"queue": "slow"},
@@ -252,3 +289,19 @@ CELERY_TASK_ROUTES = {
     "send_outline_notification": {"queue": "fast"},
     "send_post_generation_notification": {"queue": "fast"},
 }
+
+# Cache: `embeddings` holds query embeddings and `matches` the proposals of `match_proposals`, shared by every process
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "embeddings": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": env("EMBEDDING_CACHE_URL", default=CELERY_BROKER_URL),
+        "KEY_PREFIX": "observo",
+    },
+    "matches": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": env("MATCH_CACHE_URL", default=CELERY_BROKER_URL),
+        "KEY_PREFIX": "observo",
+    },
+}
+MATCH_CACHE_TIMEOUT = env.int("MATCH_CACHE_TIMEOUT", default=24 * 60 * 60)  # 1 day
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin
 
-from opportunity.models import Opportunity
+from opportunity.models import Opportunity, VectorizationRun
 
 
 @admin.register(Opportunity)
@@ -14,6 +14,7 @@ class OpportunityAdmin(ModelAdmin):
         "created_at",
     )
     list_filter = ("vectorized",)
+    list_before_template = "admin/opportunity/vectorization_progress.html"
     search_fields = (
         "title",
         "head",
@@ -22,6 +23,7 @@ class OpportunityAdmin(ModelAdmin):
     readonly_fields = (
         "id",
         "vectorized",
+        "content_hash",
         "source",
         "injection_date",
         "created_at",
@@ -34,6 +36,47 @@ class OpportunityAdmin(ModelAdmin):
         ("Timeline", {"fields": ("categories", "funding", "awards")}),
         ("Details", {"fields": ("opened", "closed", "archived")}),
         ("Description", {"fields": ("summary", "eligibility", "instruction")}),
-        ("System Info", {"fields": ("applications", "success_rate", "vectorized", "source")}),
+        ("System Info", {"fields": ("applications", "success_rate", "vectorized", "content_hash", "source")}),
         ("Timestamps", {"fields": ("injection_date", "created_at", "updated_at")}),
     ]
+
+    def changelist_view(self, request, extra_context=None):
+        # Progress of the latest vectorization, shown above the list next to the `vectorized` filter
+        extra_context = {
+            **(extra_context or {}),
+            "vectorization": VectorizationRun.objects.order_by("-created_at").first(),
+            "pending": Opportunity.objects.filter(vectorized=False).count(),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(VectorizationRun)
+class VectorizationRunAdmin(ModelAdmin):
+    list_display = ("__str__", "progress", "chunks", "failed", "created_at", "finished_at")
+    ordering = ("-created_at",)
+    readonly_fields = (
+        "total",
+        "shards",
+        "done",
+        "failed",
+        "chunks",
+        "deleted",
+        "error",
+        "created_at",
+        "updated_at",
+        "finished_at",
+    )
+
+    fieldsets = [
+        ("Progress", {"fields": ("total", "shards", "done", "failed")}),
+        ("Chunks", {"fields": ("chunks", "deleted")}),
+        ("Errors", {"fields": ("error",)}),
+        ("Timestamps", {"fields": ("created_at", "updated_at", "finished_at")}),
+    ]
+
+    @admin.display(description="Progress")
+    def progress(self, obj: VectorizationRun) -> str:
+        return f"{obj.progress}%"
+
+    def has_add_permission(self, request) -> bool:
+        return False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class OpportunityConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "opportunity"
+
+    def ready(self):
+        # Register signals
+        import opportunity.signals  # noqa
@@ -1,80 +1,147 @@
-import datetime
-
-import numpy as np
-import pandas as pd
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from tqdm import tqdm
-
-from opportunity.models import Opportunity
-
-MODEL_CSV_MAPPING = {
-    "id": "opportunity_id",
-    "identifier": "opportunity_number",
-    "title": "opportunity_title",
-    "code": "agency_code",
-    "agency": "agency_name",
-    "head": "top_level_agency_name",
-    "categories": "funding_categories",
-    "opened": "post_date",
-    "closed": "close_date",
-    "instruction": "close_date_description",
-    "archived": "archive_date",
-    "awards": "expected_number_of_awards",
-    "funding": "award_ceiling",
-    "link": "additional_info_url",
-    "eligibility": "applicant_eligibility_description",
-    "summary": "summary_description",
-}
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from opportunity.services.ingestion import IngestionDiff, IngestionResult, dry_run, ingest
+from opportunity.tasks import vectorize_grants
 
 
 class Command(BaseCommand):
-    help = "Inject Grants from CSV provided by https://simpler.grants.gov/"
+    help = "Inject Grants from exports provided by https://simpler.grants.gov/ (CSV, zipped CSV, Parquet or Arrow)"
 
     def add_arguments(self, parser):
-        parser.add_argument("path", help="Path to CSV provided by https://simpler.grants.gov/.")
+        parser.add_argument(
+            "paths",
+            nargs="+",
+            help="Paths or glob patterns of .csv, .csv.gz, .zip, .parquet or .arrow/.feather exports to inject.",
+        )
         parser.add_argument("--no-progress", action="store_true", help="Disable tqdm progress bar.")
+        parser.add_argument(
+            "--bulk",
+            action="store_true",
+            help="Stage rows with PostgreSQL COPY and merge them with a single INSERT ... ON CONFLICT.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10_000,
+            help="Number of CSV rows read and committed at a time; bounds memory and transaction length.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of files parsed, normalized and written in parallel. Parallel runs always use --bulk.",
+        )
+        parser.add_argument(
+            "--restart", action="store_true", help="Ignore the stored checkpoints and ingest the files from the start."
+        )
+        parser.add_argument("--rejects-dir", help="Directory for reject reports (defaults to next to each file).")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report how many Grants would be created, updated or left unchanged without writing anything.",
+        )
+        parser.add_argument("--sample", type=int, default=10, help="Number of updated Grants listed by --dry-run.")
+        parser.add_argument(
+            "--no-vectorize", action="store_true", help="Do not queue vectorization of the new and updated Grants."
+        )
 
-    @transaction.atomic
     def handle(self, *args, **options):
-        data = pd.read_csv(options["path"])
-        data.replace({np.nan: None}, inplace=True)
+        paths = self._expand(options["paths"])
+        if options["dry_run"]:
+            self._report_diff(diff=dry_run(paths, chunksize=options["chunk_size"], sample=options["sample"]))
+            return
 
-        n_created, n_updated = 0, 0
-        injection_date = datetime.date.today()
+        workers = max(min(options["workers"], len(paths)), 1)
+        kwargs = {
+            "chunksize": options["chunk_size"],
+            "restart": options["restart"],
+            "rejects_dir": options["rejects_dir"],
+        }
 
-        records = data.to_dict(orient="records")
-        iterator = records if options["no_progress"] else tqdm(records, total=len(records), unit="row")
+        changed, failed = 0, []
+        if workers == 1:
+            for path in paths:
+                result = ingest(path, bulk=options["bulk"], progress=not options["no_progress"], **kwargs)
+                self._report(result=result)
+                changed += result.created + result.updated
+            self._vectorize(changed=changed, enabled=not options["no_vectorize"])
+            return
 
-        for row in iterator:
-            identifier = row[MODEL_CSV_MAPPING["id"]]
-            values = {"source": options["path"], "injection_date": injection_date}
-            for model_key, csv_key in MODEL_CSV_MAPPING.items():
-                if model_key == "id":
-                    continue
+        self.stdout.write(f"Injecting {len(paths)} files with {workers} workers")
 
-                if not model_key == "categories":
-                    values[model_key] = row[csv_key]
-                else:
-                    values[model_key] = row[csv_key].split(";")
+        # Worker processes open their own database connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+        ) as executor:
+            futures = {executor.submit(ingest, path, bulk=True, **kwargs): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as exc:  # pylint: disable=too-broad-exception
+                    self.stdout.write(self.style.ERROR(f"Failed for {futures[future]}"))
+                    self.stdout.write(self.style.ERROR(str(exc)))
+                    failed.append(futures[future])
+                    continue
+                self._report(result=result)
+                changed += result.created + result.updated
 
-                if model_key == "awards" or model_key == "funding":
-                    if row[csv_key] is not None:
-                        values[model_key] = int(row[csv_key])
+        self._vectorize(changed=changed, enabled=not options["no_vectorize"])
+        if failed:
+            raise CommandError(f"Failed to inject {len(failed)} of {len(paths)} files: {', '.join(sorted(failed))}")
 
-            try:
-                opportunity, created = Opportunity.objects.update_or_create(id=identifier, defaults=values)
-            except Exception as exc:  # pylint: disable=too-broad-exception
-                self.stdout.write(self.style.ERROR(f"Failed for {identifier}"))
-                self.stdout.write(self.style.ERROR(str(exc)))
-                return
+    def _vectorize(self, changed: int, enabled: bool) -> None:
+        if changed and enabled:
+            vectorize_grants.delay()
+            self.stdout.write("Queued vectorization of the new and updated Grants.")
 
-            if created:
-                n_created += 1
-            else:
-                n_updated += 1
+    def _report(self, result: IngestionResult) -> None:
+        if result.resumed_from:
+            self.stdout.write(self.style.NOTICE(f"Resumed {result.path} from row {result.resumed_from}"))
 
-        self.stdout.write(self.style.SUCCESS("Successfully injected Grants from CSV provided."))
+        n_created, n_updated = result.created, result.updated
+        self.stdout.write(self.style.SUCCESS(f"Successfully injected Grants from {result.path}."))
         self.stdout.write(
             self.style.SUCCESS(f"Updated {n_updated} and created {n_created} Grants ({n_created + n_updated} total).")
         )
+        if result.unchanged:
+            self.stdout.write(f"Left {result.unchanged} unchanged Grants untouched.")
+        if result.superseded:
+            self.stdout.write(f"Skipped {result.superseded} rows superseded by later postings ingested today.")
+        if result.rejected:
+            self.stdout.write(self.style.WARNING(f"Rejected {result.rejected} rows, see {result.rejects_path}"))
+
+    def _report_diff(self, diff: IngestionDiff) -> None:
+        self.stdout.write(self.style.NOTICE("Dry run, nothing was written."))
+        self.stdout.write(
+            f"Would create {diff.new}, update {diff.updated} and leave {diff.unchanged} Grants unchanged."
+        )
+        if diff.stale:
+            self.stdout.write(f"Would skip {diff.stale} rows superseded by later postings ingested today.")
+        if diff.duplicated:
+            self.stdout.write(f"Found {diff.duplicated} repeated Grant ids.")
+        if diff.rejected:
+            self.stdout.write(self.style.WARNING(f"Would reject {diff.rejected} rows."))
+
+        if diff.changed_fields:
+            counts = ", ".join(f"{name} ({count})" for name, count in diff.changed_fields.most_common())
+            self.stdout.write(f"Changed fields: {counts}")
+        for identifier, changed in diff.samples.items():
+            self.stdout.write(f"  {identifier}: {', '.join(changed)}")
+
+    @staticmethod
+    def _expand(patterns: list[str]) -> list[str]:
+        paths = []
+        for pattern in patterns:
+            matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            if not matches:
+                raise CommandError(f"No files match {pattern}")
+            paths.extend(path for path in matches if path not in paths)
+        return paths
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from opportunity.services.sync import GrantsClient, sync
+from opportunity.tasks import vectorize_grants
+
+
+class Command(BaseCommand):
+    help = "Sync Grants modified since the last sync from the grants API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default=settings.GRANTS_API_URL,
+            help="Paginated JSON endpoint to sync from, see GrantsClient (defaults to GRANTS_API_URL).",
+        )
+        parser.add_argument("--page-size", type=int, default=100, help="Number of Grants requested per page.")
+        parser.add_argument("--workers", type=int, default=4, help="Number of pages fetched concurrently.")
+        parser.add_argument("--full", action="store_true", help="Ignore the stored cursor and sync every Grant.")
+        parser.add_argument(
+            "--no-vectorize", action="store_true", help="Do not queue vectorization of the new and updated Grants."
+        )
+
+    def handle(self, *args, **options):
+        if not options["url"]:
+            raise CommandError("Set GRANTS_API_URL or pass --url.")
+
+        client = GrantsClient(url=options["url"], api_key=settings.GRANTS_API_KEY, page_size=options["page_size"])
+        result = sync(client, workers=max(options["workers"], 1), full=options["full"])
+
+        n_created, n_updated = result.created, result.updated
+        since = result.since.isoformat() if result.since else "the beginning"
+        self.stdout.write(self.style.SUCCESS(f"Synced {result.pages} pages of Grants modified since {since}."))
+        self.stdout.write(
+            self.style.SUCCESS(f"Updated {n_updated} and created {n_created} Grants ({n_created + n_updated} total).")
+        )
+        if result.unchanged:
+            self.stdout.write(f"Left {result.unchanged} unchanged Grants untouched.")
+        if result.superseded:
+            self.stdout.write(f"Skipped {result.superseded} Grants superseded by later postings ingested today.")
+        if result.rejected:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Rejected {result.rejected} Grants, see the log for details; the next sync fetches them again."
+                )
+            )
+        if result.cursor:
+            self.stdout.write(f"Next sync starts from {result.cursor.isoformat()}.")
+        if n_created + n_updated and not options["no_vectorize"]:
+            vectorize_grants.delay()
+            self.stdout.write("Queued vectorization of the new and updated Grants.")
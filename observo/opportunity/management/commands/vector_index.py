@@ -0,0 +1,131 @@
+from math import ceil, sqrt
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from opportunity.models import VECTOR_INDEX, OpportunityChunk
+from opportunity.services.retrieval import nearest_chunk_ids
+from utils.vector_db import PRECISIONS
+
+
+class Command(BaseCommand):
+    help = (
+        "Create, rebuild, drop, report on or measure the recall of the approximate nearest neighbour index of the "
+        "Grants vector database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=("create", "rebuild", "drop", "report", "recall"))
+        parser.add_argument("--method", choices=("hnsw", "ivfflat"), default="hnsw")
+        parser.add_argument(
+            "--precision",
+            choices=PRECISIONS,
+            default=settings.VECTOR_PRECISION,
+            help="Precision of the indexed vectors (defaults to VECTOR_PRECISION, which searches must match).",
+        )
+        parser.add_argument("--m", type=int, default=16, help="HNSW: maximum connections per layer.")
+        parser.add_argument("--ef-construction", type=int, default=64, help="HNSW: candidate list size while building.")
+        parser.add_argument("--lists", type=int, help="IVFFlat: number of lists (defaults to rows / 1000 or sqrt).")
+        parser.add_argument("--maintenance-work-mem", help="Memory for the build, e.g. 2GB; faster when it fits.")
+        parser.add_argument("--samples", type=int, default=20, help="Recall: number of chunks used as queries.")
+        parser.add_argument("--k", type=int, default=50, help="Recall: number of nearest chunks compared.")
+        parser.add_argument("--ef-search", type=int, help="Recall: HNSW scan list size (defaults to VECTOR_EF_SEARCH).")
+        parser.add_argument("--probes", type=int, help="Recall: IVFFlat lists scanned (defaults to VECTOR_PROBES).")
+
+    def handle(self, *args, **options) -> None:
+        self.table = OpportunityChunk._meta.db_table
+
+        if options["action"] == "report":
+            self._report()
+            return
+
+        if options["action"] == "recall":
+            self._recall(
+                options["samples"], options["k"], options["precision"], options["ef_search"], options["probes"]
+            )
+            return
+
+        if options["action"] in ("drop", "rebuild"):
+            self._execute(f"DROP INDEX CONCURRENTLY IF EXISTS {VECTOR_INDEX}")
+            self.stdout.write(self.style.SUCCESS(f"Dropped {VECTOR_INDEX}."))
+            if options["action"] == "drop":
+                return
+        elif self._definition() is not None:
+            raise CommandError(f"{VECTOR_INDEX} already exists, use `rebuild` to replace it.")
+
+        if options["maintenance_work_mem"]:
+            self._execute("SET maintenance_work_mem = %s", [options["maintenance_work_mem"]])
+
+        if options["method"] == "hnsw":
+            parameters = f"m = {options['m']}, ef_construction = {options['ef_construction']}"
+        else:
+            parameters = f"lists = {options['lists'] or self._default_lists()}"
+
+        # Matches rank chunks by cosine distance, or by Hamming distance once binary quantized
+        precision = PRECISIONS[options["precision"]]
+        self.stdout.write(
+            f"Building {options['precision']} precision {options['method']} index ({parameters}), "
+            f"this may take a while..."
+        )
+        self._execute(
+            f"CREATE INDEX CONCURRENTLY {VECTOR_INDEX} ON {self.table} "
+            f"USING {options['method']} (({precision.expression('embedding')}) {precision.opclass}) WITH ({parameters})"
+        )
+        self.stdout.write(self.style.SUCCESS(f"Created {VECTOR_INDEX}."))
+        self._report()
+
+    def _report(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {self.table}")
+            (n_chunks,) = cursor.fetchone()
+            cursor.execute(
+                "SELECT i.indisvalid, pg_size_pretty(pg_relation_size(i.indexrelid)) "
+                "FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+                [VECTOR_INDEX],
+            )
+            index = cursor.fetchone()
+            cursor.execute("SELECT current_setting('hnsw.ef_search', true), current_setting('ivfflat.probes', true)")
+            ef_search, probes = cursor.fetchone()
+
+        self.stdout.write(f"{self.table}: {n_chunks} chunks")
+        if index is None:
+            self.stdout.write(self.style.WARNING(f"{VECTOR_INDEX} does not exist; searches scan every chunk."))
+            return
+
+        valid, size = index
+        self.stdout.write(self._definition())
+        self.stdout.write(f"Size {size}, {'valid' if valid else 'INVALID (rebuild it)'}")
+        self.stdout.write(f"Defaults: hnsw.ef_search = {ef_search}, ivfflat.probes = {probes}")
+
+    def _recall(self, samples: int, k: int, precision: str, ef_search: int | None, probes: int | None) -> None:
+        queries = list(OpportunityChunk.objects.order_by("?").values_list("embedding", flat=True)[:samples])
+        if not queries:
+            raise CommandError(f"{self.table} is empty, vectorize some Grants first.")
+
+        found = 0
+        for query in queries:
+            approximate = set(nearest_chunk_ids(query, k, precision=precision, ef_search=ef_search, probes=probes))
+            # Exact neighbours come from a sequential scan of the full-precision vectors
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_indexscan = off")
+                exact = nearest_chunk_ids(query, k, precision="full")
+            found += len(approximate.intersection(exact)) / max(len(exact), 1)
+
+        recall = found / len(queries)
+        self.stdout.write(f"Recall@{k} at {precision} precision: {recall:.3f} over {len(queries)} queries")
+
+    def _definition(self) -> str | None:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", [VECTOR_INDEX])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _default_lists(self) -> int:
+        rows = OpportunityChunk.objects.count()
+        return max(ceil(rows / 1000) if rows <= 1_000_000 else ceil(sqrt(rows)), 1)
+
+    @staticmethod
+    def _execute(sql: str, params: list | None = None) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
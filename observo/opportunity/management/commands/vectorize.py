@@ -1,48 +1,98 @@
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from langchain_core.documents import Document
+from django.core.management.base import BaseCommand, CommandError
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from tqdm import tqdm
 
-from opportunity.models import Opportunity
-from utils.vector_db import store
+from opportunity.services.corpus import refresh_corpus_stats
+from opportunity.services.vectorization import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    mark_title_duplicates,
+    pending_opportunities,
+    vectorize_opportunities,
+)
+from opportunity.tasks import vectorize_grants
+from utils.embeddings import EmbeddingPipeline
+from utils.vector_db import embeddings
 
 
 class Command(BaseCommand):
     help = "Inject Grants to vector database"
 
     def add_arguments(self, parser):
-        parser.add_argument("--chunk-size", required=False, default=1200)
-        parser.add_argument("--chunk-overlap", required=False, default=150)
+        parser.add_argument("--chunk-size", type=int, required=False, default=CHUNK_SIZE)
+        parser.add_argument("--chunk-overlap", type=int, required=False, default=CHUNK_OVERLAP)
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=500,
+            help="Number of Grants embedded and marked as vectorized at a time; bounds memory and lost work.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Largest number of chunks per embedding request; halved on rate limits and grown back afterwards.",
+        )
+        parser.add_argument("--concurrency", type=int, default=4, help="Number of embedding requests in flight.")
+        parser.add_argument(
+            "--background",
+            action="store_true",
+            help="Queue the work as Celery tasks sharded across the workers instead of running it here.",
+        )
+        parser.add_argument("--shard-size", type=int, default=200, help="Number of Grants per Celery task.")
 
-    @transaction.atomic
     def handle(self, *args, **options) -> None:
-        counter = 0
-        documents = []
+        if options["background"]:
+            vectorize_grants.delay(shard_size=options["shard_size"])
+            self.stdout.write(self.style.SUCCESS("Queued vectorization, follow its progress in the Opportunity admin."))
+            return
+
+        qs = pending_opportunities()
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=options["chunk_size"], chunk_overlap=options["chunk_overlap"]
+        )
+        cache = embeddings()
+        pipeline = EmbeddingPipeline(
+            embeddings=cache.embeddings,
+            batch_size=options["batch_size"],
+            concurrency=options["concurrency"],
+        )
 
-        qs = Opportunity.objects.exclude(vectorized=True).order_by("title", "id").distinct("title")
+        n_grants, n_chunks, n_deleted, last_title = 0, 0, 0, None
+        bar = tqdm(total=qs.count(), unit="grant")
+        while True:
+            page = list((qs.filter(title__gt=last_title) if last_title is not None else qs)[: options["page_size"]])
+            if not page:
+                break
 
-        for opportunity in tqdm(qs.iterator(), total=qs.count(), unit="grant"):
-            documents.append(
-                Document(
-                    page_content=opportunity.describe(),
-                    metadata={"id": str(opportunity.id), "funding": opportunity.funding is not None},
+            try:
+                # Only chunks missing from the embedding cache are sent to the pipeline
+                inserted, deleted = vectorize_opportunities(
+                    page, splitter=splitter, embed=lambda texts: cache.embed_documents(texts, embed=pipeline.embed)
                 )
-            )
-            counter += 1
+            except Exception as exc:  # pylint: disable=too-broad-exception
+                bar.close()
+                refresh_corpus_stats()
+                raise CommandError(
+                    f"Stopped after {n_grants} Grants (#chunks = {n_chunks}): {exc}. Run again to continue."
+                ) from exc
 
-        chunks = self._chunk(raw=documents, chunk_size=options["chunk_size"], chunk_overlap=options["chunk_overlap"])
-        if not chunks:
-            self.stdout.write(self.style.NOTICE("No chunks were found!"))
-            return
+            mark_title_duplicates(page)
 
-        vector_store = store()
-        vector_store.add_documents(chunks)
+            n_grants += len(page)
+            n_chunks += inserted
+            n_deleted += deleted
+            last_title = page[-1].title
+            bar.update(len(page))
+            bar.set_postfix(batch=pipeline.batch_size)
 
-        qs.update(vectorized=True)
-        self.stdout.write(self.style.SUCCESS(f"Successfully injected {counter} Grants (#chunks = {len(chunks)})!"))
+        bar.close()
+        stats = refresh_corpus_stats()
+        if not n_grants:
+            self.stdout.write(self.style.NOTICE("No chunks were found!"))
+            return
 
-    @staticmethod
-    def _chunk(raw: list[Document], chunk_size: int, chunk_overlap: int) -> list[Document]:
-        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        return splitter.split_documents(list(raw))
+        self.stdout.write(self.style.SUCCESS(f"Successfully injected {n_grants} Grants (#chunks = {n_chunks})!"))
+        if n_deleted:
+            self.stdout.write(f"Replaced {n_deleted} outdated chunks.")
+        self.stdout.write(f"Corpus: {stats.documents} Grants, {stats.chunks_per_doc:.1f} chunks per Grant.")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0015_alter_opportunity_injection_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestionCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Created At")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated At")),
+                (
+                    "source",
+                    models.CharField(
+                        help_text="Absolute path of the file being ingested.", max_length=1024, unique=True
+                    ),
+                ),
+                (
+                    "rows",
+                    models.PositiveBigIntegerField(default=0, help_text="Number of data rows already committed."),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
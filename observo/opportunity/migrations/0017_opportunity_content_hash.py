@@ -0,0 +1,91 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:02
+
+import hashlib
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of describe() as it was when content hashes were introduced
+DESCRIBED_FIELDS = (
+    "title",
+    "agency",
+    "head",
+    "categories",
+    "awards",
+    "funding",
+    "eligibility",
+    "instruction",
+    "summary",
+    "source",
+)
+
+
+def _clean_text(s):
+    if not s:
+        return None
+    s = re.sub(r"\s+", " ", str(s)).strip()
+    return s or None
+
+
+def _line(label, value):
+    return f"{label}: {value}" if value else None
+
+
+def describe(opportunity) -> str:
+    title, agency, head = (
+        _clean_text(opportunity.title),
+        _clean_text(opportunity.agency),
+        _clean_text(opportunity.head),
+    )
+    agency_line = (
+        f"{agency} | Top-level: {head}" if agency and head else agency or (f"Top-level: {head}" if head else None)
+    )
+    categories = ", ".join([c for c in (opportunity.categories or []) if _clean_text(c)])
+    parts = [
+        title,
+        _line("Agency", agency_line),
+        _line("Categories", categories or None),
+        _line("Expected Awards", f"{opportunity.awards:,}" if opportunity.awards is not None else None),
+        _line("Estimated Funding", f"{opportunity.funding:,}" if opportunity.funding is not None else None),
+        _line("Eligibility", _clean_text(opportunity.eligibility)),
+        _line("Submission Instruction", _clean_text(opportunity.instruction)),
+        _line("Summary", _clean_text(opportunity.summary)),
+        _line("Source", _clean_text(opportunity.source)),
+    ]
+    text = "\n".join([p for p in parts if p])
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+def backfill_content_hash(apps, schema_editor) -> None:
+    Opportunity = apps.get_model("opportunity", "Opportunity")
+
+    batch = []
+    for opportunity in Opportunity.objects.only("id", *DESCRIBED_FIELDS).iterator(chunk_size=2000):
+        opportunity.content_hash = hashlib.sha256(describe(opportunity).encode("utf-8")).hexdigest()
+        batch.append(opportunity)
+        if len(batch) == 2000:
+            Opportunity.objects.bulk_update(batch, ["content_hash"])
+            batch = []
+
+    Opportunity.objects.bulk_update(batch, ["content_hash"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0016_ingestioncheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="opportunity",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="SHA-256 of the text returned by describe().",
+                max_length=64,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_content_hash, reverse_code=migrations.RunPython.noop),
+    ]
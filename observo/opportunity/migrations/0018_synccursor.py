@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0017_opportunity_content_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncCursor",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Created At")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated At")),
+                (
+                    "source",
+                    models.CharField(help_text="URL of the synced grants API.", max_length=1024, unique=True),
+                ),
+                (
+                    "cursor",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="Latest modification time already synced; the next sync starts from here.",
+                        null=True,
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
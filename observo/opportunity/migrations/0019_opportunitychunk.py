@@ -0,0 +1,128 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:20
+
+import hashlib
+import uuid
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import pgvector.django.indexes
+import pgvector.django.vector
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+CHUNK_NAMESPACE = uuid.UUID("6f1c0f3e-8a53-4f0e-9b1a-2d6c5c1e7a40")
+
+
+def chunk_id(opportunity_id: str, index: int, text: str) -> str:
+    # Frozen copy of utils.vector_db.chunk_id
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{opportunity_id}:{index}:{digest}"))
+
+
+def copy_langchain_chunks(apps, schema_editor) -> None:
+    # Reuse the embeddings stored by the former LangChain PGVector collection instead of paying for them again.
+    # Its rows carry no chunk position and random uuids, but each Grant's chunks were inserted in document order by
+    # a single add_documents() call into an append-only table, so their physical order is the document order.
+    connection = schema_editor.connection
+    if "langchain_pg_embedding" not in connection.introspection.table_names():
+        return
+
+    Opportunity = apps.get_model("opportunity", "Opportunity")
+    OpportunityChunk = apps.get_model("opportunity", "OpportunityChunk")
+
+    with connection.chunked_cursor() as cursor:
+        cursor.execute(
+            f"SELECT o.id, e.document, e.embedding::text, o.funding, o.closed, o.categories "
+            f"FROM langchain_pg_embedding e "
+            f"JOIN langchain_pg_collection c ON c.uuid = e.collection_id AND c.name = 'opportunities' "
+            f"JOIN {Opportunity._meta.db_table} o ON o.id::text = e.cmetadata->>'id' "
+            f"WHERE vector_dims(e.embedding) = 768 "
+            f"ORDER BY o.id, e.ctid"
+        )
+        previous, index = None, 0
+        while rows := cursor.fetchmany(BATCH_SIZE):
+            chunks = []
+            for opportunity_id, text, embedding, funding, closed, categories in rows:
+                index = index + 1 if opportunity_id == previous else 0
+                previous = opportunity_id
+                chunks.append(
+                    OpportunityChunk(
+                        id=chunk_id(str(opportunity_id), index, text),
+                        opportunity_id=opportunity_id,
+                        index=index,
+                        text=text,
+                        embedding=[float(value) for value in embedding.strip("[]").split(",")],
+                        funding=funding,
+                        closed=closed,
+                        categories=categories,
+                    )
+                )
+            OpportunityChunk.objects.bulk_create(chunks, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0018_synccursor"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OpportunityChunk",
+            fields=[
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Created At")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated At")),
+                (
+                    "id",
+                    models.UUIDField(
+                        editable=False,
+                        help_text="Derived from the Grant, position and text.",
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("index", models.PositiveIntegerField(help_text="Position of the chunk within the described Grant.")),
+                ("text", models.TextField()),
+                ("embedding", pgvector.django.vector.VectorField(dimensions=768)),
+                (
+                    "funding",
+                    models.PositiveBigIntegerField(blank=True, null=True, verbose_name="Estimated Program Funding"),
+                ),
+                ("closed", models.DateField(blank=True, null=True, verbose_name="Closing Date")),
+                (
+                    "categories",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=255), blank=True, null=True, verbose_name="Categories"
+                    ),
+                ),
+                (
+                    "opportunity",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="chunks",
+                        to="opportunity.opportunity",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    pgvector.django.indexes.HnswIndex(
+                        ef_construction=64,
+                        fields=["embedding"],
+                        m=16,
+                        name="opportunity_chunk_embedding",
+                        opclasses=["vector_cosine_ops"],
+                    ),
+                    models.Index(fields=["funding"], name="opportunity_chunk_funding"),
+                    models.Index(fields=["closed"], name="opportunity_chunk_closed"),
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["categories"], name="opportunity_chunk_categories"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(fields=("opportunity", "index"), name="unique_opportunity_chunk")
+                ],
+            },
+        ),
+        migrations.RunPython(copy_langchain_chunks, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0019_opportunitychunk"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VectorizationRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Created At")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated At")),
+                ("total", models.PositiveIntegerField(help_text="Number of Grants queued for vectorization.")),
+                ("shards", models.PositiveIntegerField(help_text="Number of tasks the Grants were split into.")),
+                ("done", models.PositiveIntegerField(default=0, help_text="Number of Grants vectorized so far.")),
+                (
+                    "failed",
+                    models.PositiveIntegerField(default=0, help_text="Grants of failed tasks, left for the next run."),
+                ),
+                ("chunks", models.PositiveIntegerField(default=0, help_text="Number of chunks embedded and stored.")),
+                ("deleted", models.PositiveIntegerField(default=0, help_text="Number of outdated chunks replaced.")),
+                ("error", models.TextField(blank=True, default="", help_text="Last error raised by a task.")),
+                ("finished_at", models.DateTimeField(blank=True, null=True, verbose_name="Finished At")),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
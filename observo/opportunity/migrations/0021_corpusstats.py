@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0020_vectorizationrun"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CorpusStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Created At")),
+                ("updated_at", models.DateTimeField(auto_now=True, verbose_name="Updated At")),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="Searched collection the figures describe.", max_length=255, unique=True
+                    ),
+                ),
+                ("documents", models.PositiveIntegerField(default=0, help_text="Number of Grants with stored chunks.")),
+                ("chunks", models.PositiveBigIntegerField(default=0, help_text="Number of stored chunks.")),
+                (
+                    "vectorized",
+                    models.PositiveIntegerField(default=0, help_text="Number of Grants marked as vectorized."),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "Corpus Stats",
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0021_corpusstats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="corpusstats",
+            name="version",
+            field=models.PositiveBigIntegerField(default=0, help_text="Bumped whenever searchable chunks change."),
+        ),
+    ]
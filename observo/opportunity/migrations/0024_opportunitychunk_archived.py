@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+def copy_archived(apps, schema_editor) -> None:
+    chunks = apps.get_model("opportunity", "OpportunityChunk")._meta.db_table
+    opportunities = apps.get_model("opportunity", "Opportunity")._meta.db_table
+    schema_editor.execute(
+        f"UPDATE {chunks} c SET archived = o.archived FROM {opportunities} o "
+        f"WHERE c.opportunity_id = o.id AND o.archived IS NOT NULL"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0023_opportunity_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="opportunitychunk",
+            name="archived",
+            field=models.DateField(blank=True, null=True, verbose_name="Archiving Date"),
+        ),
+        migrations.RunPython(copy_archived, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="opportunitychunk",
+            index=models.Index(fields=["archived"], name="opportunity_chunk_archived"),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0024_opportunitychunk_archived"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestioncheckpoint",
+            name="fingerprint",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Size and modification time of the file when it was read.",
+                max_length=255,
+            ),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:30
+
+import hashlib
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+# Frozen copy of describe() once the source line was dropped from it
+DESCRIBED_FIELDS = (
+    "title",
+    "agency",
+    "head",
+    "categories",
+    "awards",
+    "funding",
+    "eligibility",
+    "instruction",
+    "summary",
+)
+
+
+def _clean_text(s):
+    if not s:
+        return None
+    s = re.sub(r"\s+", " ", str(s)).strip()
+    return s or None
+
+
+def _line(label, value):
+    return f"{label}: {value}" if value else None
+
+
+def describe(opportunity) -> str:
+    title, agency, head = (
+        _clean_text(opportunity.title),
+        _clean_text(opportunity.agency),
+        _clean_text(opportunity.head),
+    )
+    agency_line = (
+        f"{agency} | Top-level: {head}" if agency and head else agency or (f"Top-level: {head}" if head else None)
+    )
+    categories = ", ".join([c for c in (opportunity.categories or []) if _clean_text(c)])
+    parts = [
+        title,
+        _line("Agency", agency_line),
+        _line("Categories", categories or None),
+        _line("Expected Awards", f"{opportunity.awards:,}" if opportunity.awards is not None else None),
+        _line("Estimated Funding", f"{opportunity.funding:,}" if opportunity.funding is not None else None),
+        _line("Eligibility", _clean_text(opportunity.eligibility)),
+        _line("Submission Instruction", _clean_text(opportunity.instruction)),
+        _line("Summary", _clean_text(opportunity.summary)),
+    ]
+    text = "\n".join([p for p in parts if p])
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+def rehash(apps, schema_editor) -> None:
+    # Grants whose text carried a source line are vectorized again; their other chunks keep their ids and embeddings
+    Opportunity = apps.get_model("opportunity", "Opportunity")
+
+    batch = []
+    for opportunity in Opportunity.objects.only("id", "content_hash", *DESCRIBED_FIELDS).iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        computed = hashlib.sha256(describe(opportunity).encode("utf-8")).hexdigest()
+        if computed == opportunity.content_hash:
+            continue
+        opportunity.content_hash = computed
+        opportunity.vectorized = False
+        batch.append(opportunity)
+        if len(batch) == BATCH_SIZE:
+            Opportunity.objects.bulk_update(batch, ["content_hash", "vectorized"])
+            batch = []
+
+    Opportunity.objects.bulk_update(batch, ["content_hash", "vectorized"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("opportunity", "0025_ingestioncheckpoint_fingerprint"),
+    ]
+
+    operations = [
+        migrations.RunPython(rehash, reverse_code=migrations.RunPython.noop),
+    ]
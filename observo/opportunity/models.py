@@ -1,8 +1,13 @@
+import hashlib
 import re
 import uuid
 
+from django.conf import settings
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from pgvector.django import HnswIndex, VectorField
 
 from utils.models import TimestampedModel
 
@@ -22,6 +27,76 @@ def _line(label: str, value: str | None) -> str | None:
     return f"{label}: {value}" if value else None
 
 
+# Provenance (`source`) is left out, so that re-injecting an export from another path does not re-embed it
+DESCRIBED_FIELDS = (
+    "title",
+    "agency",
+    "head",
+    "categories",
+    "awards",
+    "funding",
+    "eligibility",
+    "instruction",
+    "summary",
+)
+
+
+def describe_opportunity(
+    title: str | None,
+    agency: str | None,
+    head: str | None,
+    categories: list[str] | None,
+    awards: int | None,
+    funding: int | None,
+    eligibility: str | None,
+    instruction: str | None,
+    summary: str | None,
+) -> str:
+    parts = []
+
+    # Headline
+    title = _clean_text(title)
+    if title:
+        parts.append(title)
+
+    # Agency info
+    agency = _clean_text(agency)
+    head = _clean_text(head)
+    agency_line = (
+        f"{agency} | Top-level: {head}" if agency and head else agency or (f"Top-level: {head}" if head else None)
+    )
+    parts.append(_line("Agency", agency_line))
+
+    # Categories
+    cats = ", ".join([c for c in (categories or []) if _clean_text(c)])
+    parts.append(_line("Categories", cats if cats else None))
+
+    # Quantities
+    parts.append(_line("Expected Awards", _fmt_int(awards)))
+    parts.append(_line("Estimated Funding", _fmt_int(funding)))
+
+    # Long-form text
+    parts.append(_line("Eligibility", _clean_text(eligibility)))
+    parts.append(_line("Submission Instruction", _clean_text(instruction)))
+    parts.append(_line("Summary", _clean_text(summary)))
+
+    text = "\n".join([p for p in parts if p])
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+# Full-text search over the described fields, plus the codes people search for verbatim
+SEARCH_VECTOR = (
+    SearchVector("title", weight="A", config="english")
+    + SearchVector("identifier", "code", "agency", "head", weight="A", config="simple")
+    + SearchVector("summary", weight="B", config="english")
+    + SearchVector("eligibility", "instruction", weight="C", config="english")
+)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
 class Opportunity(TimestampedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     identifier = models.CharField(max_length=255, unique=True, verbose_name="Opportunity Number")
@@ -48,47 +123,133 @@ class Opportunity(TimestampedModel):
     success_rate = models.FloatField(null=True, blank=True, help_text="Success rate for applications.")
 
     vectorized = models.BooleanField(default=False)
+    content_hash = models.CharField(
+        max_length=64, null=True, blank=True, editable=False, help_text="SHA-256 of the text returned by describe()."
+    )
     source = models.CharField(max_length=255, null=True, blank=True)
     injection_date = models.DateField(null=True, blank=True, verbose_name="Injection Date")
+    search_vector = models.GeneratedField(expression=SEARCH_VECTOR, output_field=SearchVectorField(), db_persist=True)
 
     def describe(self) -> str:
-        parts = []
+        return describe_opportunity(**{field: getattr(self, field) for field in DESCRIBED_FIELDS})
+
+    def compute_content_hash(self) -> str:
+        return content_hash(self.describe())
 
-        # Headline
-        title = _clean_text(self.title)
-        if title:
-            parts.append(title)
+    def save(self, *args, **kwargs) -> None:
+        # Embeddings only need refreshing when the described text changes
+        computed = self.compute_content_hash()
+        if computed != self.content_hash:
+            self.content_hash = computed
+            self.vectorized = False
+            if (update_fields := kwargs.get("update_fields")) is not None:
+                kwargs["update_fields"] = {*update_fields, "content_hash", "vectorized"}
+        super().save(*args, **kwargs)
+
+    def __str__(self) -> str:
+        return self.title
 
-        # Agency info
-        agency = _clean_text(self.agency)
-        head = _clean_text(self.head)
-        agency_line = (
-            f"{agency} | Top-level: {head}" if agency and head else agency or (f"Top-level: {head}" if head else None)
-        )
-        parts.append(_line("Agency", agency_line))
+    class Meta:
+        verbose_name = "Opportunity"
+        verbose_name_plural = "Opportunities"
+        indexes = [GinIndex(fields=["search_vector"], name="opportunity_search_vector")]
 
-        # Categories
-        cats = ", ".join([c for c in (self.categories or []) if _clean_text(c)])
-        parts.append(_line("Categories", cats if cats else None))
 
-        # Quantities
-        parts.append(_line("Expected Awards", _fmt_int(self.awards)))
-        parts.append(_line("Estimated Funding", _fmt_int(self.funding)))
+class IngestionCheckpoint(TimestampedModel):
+    source = models.CharField(max_length=1024, unique=True, help_text="Absolute path of the file being ingested.")
+    rows = models.PositiveBigIntegerField(default=0, help_text="Number of data rows already committed.")
+    fingerprint = models.CharField(
+        max_length=255, blank=True, default="", help_text="Size and modification time of the file when it was read."
+    )
 
-        # Long-form text
-        parts.append(_line("Eligibility", _clean_text(self.eligibility)))
-        parts.append(_line("Submission Instruction", _clean_text(self.instruction)))
-        parts.append(_line("Summary", _clean_text(self.summary)))
+    def __str__(self) -> str:
+        return f"{self.source} ({self.rows} rows)"
 
-        # Optional provenance
-        parts.append(_line("Source", _clean_text(self.source)))
 
-        text = "\n".join([p for p in parts if p])
-        return re.sub(r"[ \t]+", " ", text).strip()
+class SyncCursor(TimestampedModel):
+    source = models.CharField(max_length=1024, unique=True, help_text="URL of the synced grants API.")
+    cursor = models.DateTimeField(
+        null=True, blank=True, help_text="Latest modification time already synced; the next sync starts from here."
+    )
 
     def __str__(self) -> str:
-        return self.title
+        return f"{self.source} (since {self.cursor})"
+
+
+class VectorizationRun(TimestampedModel):
+    total = models.PositiveIntegerField(help_text="Number of Grants queued for vectorization.")
+    shards = models.PositiveIntegerField(help_text="Number of tasks the Grants were split into.")
+    done = models.PositiveIntegerField(default=0, help_text="Number of Grants vectorized so far.")
+    failed = models.PositiveIntegerField(default=0, help_text="Grants of failed tasks, left for the next run.")
+    chunks = models.PositiveIntegerField(default=0, help_text="Number of chunks embedded and stored.")
+    deleted = models.PositiveIntegerField(default=0, help_text="Number of outdated chunks replaced.")
+    error = models.TextField(blank=True, default="", help_text="Last error raised by a task.")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+
+    @property
+    def progress(self) -> int:
+        return round(100 * (self.done + self.failed) / self.total) if self.total else 100
+
+    @property
+    def running(self) -> bool:
+        return self.finished_at is None
+
+    def __str__(self) -> str:
+        return f"Vectorization #{self.pk} ({self.done}/{self.total})"
+
+
+class CorpusStats(TimestampedModel):
+    name = models.CharField(max_length=255, unique=True, help_text="Searched collection the figures describe.")
+    documents = models.PositiveIntegerField(default=0, help_text="Number of Grants with stored chunks.")
+    chunks = models.PositiveBigIntegerField(default=0, help_text="Number of stored chunks.")
+    vectorized = models.PositiveIntegerField(default=0, help_text="Number of Grants marked as vectorized.")
+    version = models.PositiveBigIntegerField(default=0, help_text="Bumped whenever searchable chunks change.")
+
+    @property
+    def chunks_per_doc(self) -> float:
+        return self.chunks / self.documents if self.documents else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.documents} Grants, {self.chunks} chunks)"
 
     class Meta:
-        verbose_name = "Opportunity"
-        verbose_name_plural = "Opportunities"
+        verbose_name_plural = "Corpus Stats"
+
+
+# Approximate nearest neighbour index over the chunk embeddings, see the `vector_index` command
+VECTOR_INDEX = "opportunity_chunk_embedding"
+
+
+class OpportunityChunk(TimestampedModel):
+    # Opportunity fields copied onto every chunk so that matches can filter on them inside the vector query
+    FILTER_FIELDS = ("funding", "closed", "archived", "categories")
+
+    id = models.UUIDField(primary_key=True, editable=False, help_text="Derived from the Grant, position and text.")
+    opportunity = models.ForeignKey(Opportunity, on_delete=models.CASCADE, related_name="chunks")
+    index = models.PositiveIntegerField(help_text="Position of the chunk within the described Grant.")
+    text = models.TextField()
+    embedding = VectorField(dimensions=settings.EMBEDDING_DIMENSIONS)
+
+    funding = models.PositiveBigIntegerField(verbose_name="Estimated Program Funding", null=True, blank=True)
+    closed = models.DateField(verbose_name="Closing Date", null=True, blank=True)
+    archived = models.DateField(verbose_name="Archiving Date", null=True, blank=True)
+    categories = ArrayField(models.CharField(max_length=255), verbose_name="Categories", null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.opportunity_id} #{self.index}"
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=("opportunity", "index"), name="unique_opportunity_chunk")]
+        indexes = [
+            HnswIndex(
+                name=VECTOR_INDEX,
+                fields=["embedding"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+            models.Index(fields=["funding"], name="opportunity_chunk_funding"),
+            models.Index(fields=["closed"], name="opportunity_chunk_closed"),
+            models.Index(fields=["archived"], name="opportunity_chunk_archived"),
+            GinIndex(fields=["categories"], name="opportunity_chunk_categories"),
+        ]
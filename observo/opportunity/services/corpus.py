@@ -0,0 +1,41 @@
+import logging
+from math import ceil
+
+from django.db.models import Count, F
+
+from opportunity.models import CorpusStats, Opportunity, OpportunityChunk
+
+logger = logging.getLogger(__name__)
+
+CORPUS = "opportunities"
+DEFAULT_CHUNKS_PER_DOC = 4
+
+
+def refresh_corpus_stats() -> CorpusStats:
+    """Recount the chunks and vectorized Grants; called whenever vectorization or ingestion changed them."""
+    counts = OpportunityChunk.objects.aggregate(chunks=Count("id"), documents=Count("opportunity", distinct=True))
+    stats, _ = CorpusStats.objects.update_or_create(
+        name=CORPUS,
+        defaults={**counts, "vectorized": Opportunity.objects.filter(vectorized=True).count()},
+    )
+    logger.debug(f"Corpus stats refreshed: {stats}")
+    return stats
+
+
+def bump_corpus_version() -> None:
+    """Invalidate everything derived from the searchable chunks, such as cached match proposals."""
+    if not CorpusStats.objects.filter(name=CORPUS).update(version=F("version") + 1):
+        CorpusStats.objects.get_or_create(name=CORPUS, defaults={"version": 1})
+
+
+def corpus_version() -> int:
+    return CorpusStats.objects.filter(name=CORPUS).values_list("version", flat=True).first() or 0
+
+
+def chunks_per_doc() -> int:
+    """Average number of chunks per vectorized Grant, read from the stored corpus stats."""
+    stats = CorpusStats.objects.filter(name=CORPUS).first()
+    if stats is None or not stats.documents:
+        logger.warning(f"Corpus stats are missing; defaulting to {DEFAULT_CHUNKS_PER_DOC} chunks per Grant")
+        return DEFAULT_CHUNKS_PER_DOC
+    return ceil(stats.chunks_per_doc)
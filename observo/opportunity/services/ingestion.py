@@ -0,0 +1,551 @@
+import csv
+import datetime
+import io
+import logging
+import os
+import uuid
+import zipfile
+from collections import Counter
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from django.db import DatabaseError, connection, transaction
+from tqdm import tqdm
+
+from opportunity.models import (
+    DESCRIBED_FIELDS,
+    IngestionCheckpoint,
+    Opportunity,
+    OpportunityChunk,
+    content_hash,
+    describe_opportunity,
+)
+from opportunity.services.corpus import bump_corpus_version, refresh_corpus_stats
+
+logger = logging.getLogger(__name__)
+
+MODEL_CSV_MAPPING = {
+    "id": "opportunity_id",
+    "identifier": "opportunity_number",
+    "title": "opportunity_title",
+    "code": "agency_code",
+    "agency": "agency_name",
+    "head": "top_level_agency_name",
+    "categories": "funding_categories",
+    "opened": "post_date",
+    "closed": "close_date",
+    "instruction": "close_date_description",
+    "archived": "archive_date",
+    "awards": "expected_number_of_awards",
+    "funding": "award_ceiling",
+    "link": "additional_info_url",
+    "eligibility": "applicant_eligibility_description",
+    "summary": "summary_description",
+}
+
+UPSERT_FIELDS = [*MODEL_CSV_MAPPING.keys(), "source", "injection_date", "content_hash"]
+
+INTEGER_FIELDS = ("awards", "funding")
+DATE_FIELDS = ("opened", "closed", "archived")
+REQUIRED_FIELDS = tuple(name for name in MODEL_CSV_MAPPING if not Opportunity._meta.get_field(name).null)
+LIMITED_FIELDS = {
+    name: Opportunity._meta.get_field(name).max_length
+    for name in MODEL_CSV_MAPPING
+    if name != "id" and Opportunity._meta.get_field(name).max_length
+}
+UUID_PATTERN = r"[0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}"
+
+COLUMNAR_FORMATS = {".parquet": "parquet", ".pq": "parquet", ".arrow": "ipc", ".feather": "ipc", ".ipc": "ipc"}
+
+# Stored values compared by the dry run; the fields that make up describe() are compared through ``content_hash``
+DIFF_FIELDS = tuple(name for name in UPSERT_FIELDS if name not in (*DESCRIBED_FIELDS, "id", "injection_date"))
+
+COPY_NULL = r"\N"
+STAGE_TABLE = "opportunity_stage"
+
+
+def read_frames(path: str, chunksize: int, skip: int = 0) -> Iterator[pd.DataFrame]:
+    """Stream the export at ``path`` in frames of ``chunksize`` raw rows indexed by position, after ``skip`` rows."""
+    # Compressed CSVs are decompressed on the fly, zipped ones read in name order and columnar files batch by batch
+    suffix = Path(path).suffix.lower()
+    if suffix in COLUMNAR_FORMATS:
+        frames = _skip(_read_columnar(path=path, fmt=COLUMNAR_FORMATS[suffix], chunksize=chunksize), skip=skip)
+    elif zipfile.is_zipfile(path):
+        frames = _skip(_read_zip(path=path, chunksize=chunksize), skip=skip)
+    else:
+        frames = _read_csv(source=path, chunksize=chunksize, skip=skip)
+
+    offset = skip
+    for frame in frames:
+        frame.index = pd.RangeIndex(offset, offset + len(frame))
+        offset += len(frame)
+        yield frame
+
+
+def _read_csv(source: str | IO[bytes], chunksize: int, skip: int = 0) -> Iterator[pd.DataFrame]:
+    with pd.read_csv(
+        source,
+        usecols=list(MODEL_CSV_MAPPING.values()),
+        dtype=str,
+        chunksize=chunksize,
+        skiprows=(lambda line: 0 < line <= skip) if skip else None,
+    ) as reader:
+        yield from reader
+
+
+def _read_zip(path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    with zipfile.ZipFile(path) as archive:
+        for name in sorted(name for name in archive.namelist() if name.lower().endswith(".csv")):
+            with archive.open(name) as member:
+                yield from _read_csv(source=member, chunksize=chunksize)
+
+
+def _read_columnar(path: str, fmt: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    dataset = ds.dataset(path, format=fmt)
+    for batch in dataset.to_batches(columns=list(MODEL_CSV_MAPPING.values()), batch_size=chunksize):
+        columns = {name: _as_text(batch.column(name)) for name in batch.schema.names}
+        yield pa.table(columns).to_pandas()
+
+
+def _as_text(column: pa.Array) -> pa.Array:
+    # Match the raw strings read from CSV so that ``normalize`` treats every source alike
+    if pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+        return pc.binary_join(column, ";")
+    if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+        return column
+    return pc.cast(column, pa.string())
+
+
+def _skip(frames: Iterator[pd.DataFrame], skip: int) -> Iterator[pd.DataFrame]:
+    for frame in frames:
+        if skip >= len(frame):
+            skip -= len(frame)
+            continue
+        yield frame.iloc[skip:]
+        skip = 0
+
+
+def normalize(frame: pd.DataFrame, source: str, injection_date: datetime.date) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Split a raw chunk into valid ``UPSERT_FIELDS`` rows and rejects (``row``, ``opportunity_id``, ``error``)."""
+    data = pd.DataFrame({name: frame[column] for name, column in MODEL_CSV_MAPPING.items()}, index=frame.index)
+    errors = pd.Series("", index=data.index, dtype=object)
+
+    def flag(mask: pd.Series, message: str) -> None:
+        nonlocal errors
+        errors = errors.mask(mask.fillna(False).astype(bool), errors + f"{message}; ")
+
+    for name in REQUIRED_FIELDS:
+        flag(data[name].isna(), f"{name} is missing")
+
+    flag(data["id"].notna() & ~data["id"].str.fullmatch(UUID_PATTERN, na=False).astype(bool), "id is not a valid UUID")
+
+    for name, max_length in LIMITED_FIELDS.items():
+        flag(data[name].str.len() > max_length, f"{name} is longer than {max_length} characters")
+
+    for name in INTEGER_FIELDS:
+        numbers = np.trunc(pd.to_numeric(data[name], errors="coerce"))
+        low, high = connection.ops.integer_field_range(Opportunity._meta.get_field(name).get_internal_type())
+        invalid = (numbers.isna() & data[name].notna()) | (numbers < low) | (numbers > high)
+        flag(invalid, f"{name} is not an integer between {low} and {high}")
+        data[name] = numbers.mask(invalid).astype("Int64")
+
+    for name in DATE_FIELDS:
+        dates = pd.to_datetime(data[name], errors="coerce", format="ISO8601")
+        flag(dates.isna() & data[name].notna(), f"{name} is not a valid date")
+        data[name] = dates.dt.date.where(dates.notna(), None)
+
+    data["categories"] = data["categories"].str.split(";")
+    data["source"] = source
+    data["injection_date"] = injection_date
+    data["content_hash"] = [
+        content_hash(describe_opportunity(**values)) for values in to_records(data[list(DESCRIBED_FIELDS)])
+    ]
+
+    rejected = errors != ""
+    rejects = pd.DataFrame(
+        {"row": data.index[rejected], "opportunity_id": data.loc[rejected, "id"], "error": errors[rejected]}
+    )
+    rejects["error"] = rejects["error"].str.rstrip("; ")
+    return data.loc[~rejected, UPSERT_FIELDS], rejects
+
+
+def to_records(frame: pd.DataFrame) -> list[dict[str, Any]]:
+    """Convert a normalized frame to a list of field values with missing values as ``None``."""
+    return frame.astype(object).where(frame.notna(), None).to_dict(orient="records")
+
+
+class RejectReport:
+    """CSV report of the rows that could not be ingested, written as they are found."""
+
+    FIELDS = ("row", "opportunity_id", "error")
+
+    def __init__(self, path: str, append: bool = False) -> None:
+        self.path = path
+        self.count = 0
+        self._append = append
+        self._file: io.TextIOWrapper | None = None
+        self._writer = None
+
+    def add(self, row: int, identifier: Any, error: Exception | str) -> None:
+        if self._writer is None:
+            exists = self._append and os.path.exists(self.path)
+            self._file = open(self.path, "a" if self._append else "w", newline="")
+            self._writer = csv.writer(self._file)
+            if not exists:
+                self._writer.writerow(self.FIELDS)
+
+        self._writer.writerow([row, identifier, str(error).strip()])
+        self._file.flush()
+        self.count += 1
+
+    def extend(self, rejects: pd.DataFrame) -> None:
+        for row, identifier, error in rejects[list(self.FIELDS)].itertuples(index=False):
+            self.add(row=row, identifier=identifier, error=error)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def bulk_upsert(frame: pd.DataFrame) -> tuple[int, int, int, int]:
+    """Merge a normalized ``frame`` into ``Opportunity``; returns created, updated, unchanged and superseded counts."""
+    if frame.empty:
+        return 0, 0, 0, 0
+
+    table = Opportunity._meta.db_table
+    columns = [Opportunity._meta.get_field(name).column for name in UPSERT_FIELDS]
+    column_list = ", ".join(columns)
+    assignments = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column != "id")
+    compared = [column for column in columns if column not in ("id", "injection_date")]
+    current = ", ".join(f"{table}.{column}" for column in compared)
+    incoming = ", ".join(f"EXCLUDED.{column}" for column in compared)
+
+    chunks = OpportunityChunk._meta.db_table
+    chunk_columns = [OpportunityChunk._meta.get_field(name).column for name in OpportunityChunk.FILTER_FIELDS]
+    chunk_assignments = ", ".join(f"{column} = o.{column}" for column in chunk_columns)
+    chunk_current = ", ".join(f"c.{column}" for column in chunk_columns)
+    chunk_incoming = ", ".join(f"o.{column}" for column in chunk_columns)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {STAGE_TABLE}")
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {STAGE_TABLE} ON COMMIT DROP AS "
+            f"SELECT 0::bigint AS position, {column_list} FROM {table} WITH NO DATA"
+        )
+        cursor.copy_expert(
+            f"COPY {STAGE_TABLE} (position, {column_list}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            _to_copy_buffer(frame),
+        )
+        # Repeated ids keep their latest posting, stored rows are only replaced by rows that ``supersedes`` them and
+        # ``vectorized`` is only reset when the content changes
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}, vectorized, created_at, updated_at) "
+            f"SELECT DISTINCT ON (id) {column_list}, FALSE, now(), now() FROM {STAGE_TABLE} "
+            f"ORDER BY id, opened DESC, position DESC "
+            f"ON CONFLICT (id) DO UPDATE SET {assignments}, "
+            f"vectorized = {table}.vectorized AND {table}.content_hash IS NOT DISTINCT FROM EXCLUDED.content_hash, "
+            f"updated_at = EXCLUDED.updated_at "
+            f"WHERE {_supersedes('EXCLUDED', table)} AND ({current}) IS DISTINCT FROM ({incoming}) "
+            f"RETURNING (xmax = 0)"
+        )
+        inserted = [created for (created,) in cursor.fetchall()]
+        cursor.execute(
+            f"UPDATE {chunks} c SET {chunk_assignments} FROM {table} o "
+            f"WHERE c.opportunity_id = o.id AND o.id IN (SELECT id FROM {STAGE_TABLE}) "
+            f"AND ({chunk_current}) IS DISTINCT FROM ({chunk_incoming})"
+        )
+        if cursor.rowcount:
+            bump_corpus_version()
+        cursor.execute(f"SELECT count(DISTINCT id) FROM {STAGE_TABLE}")
+        (n_rows,) = cursor.fetchone()
+        # Rows left out of the upsert that still differ from the stored ones were superseded
+        cursor.execute(
+            f"SELECT count(*) FROM (SELECT DISTINCT ON (id) {column_list} FROM {STAGE_TABLE} "
+            f"ORDER BY id, opened DESC, position DESC) s JOIN {table} ON {table}.id = s.id "
+            f"WHERE ({current}) IS DISTINCT FROM ({', '.join(f's.{column}' for column in compared)})"
+        )
+        (n_superseded,) = cursor.fetchone()
+
+    n_created = sum(inserted)
+    return n_created, len(inserted) - n_created, n_rows - len(inserted) - n_superseded, n_superseded
+
+
+def supersedes(
+    opened: datetime.date,
+    source: str | None,
+    injection_date: datetime.date,
+    current: tuple[datetime.date, str | None, datetime.date | None],
+) -> bool:
+    """Whether a row may replace the stored one whose ``(opened, source, injection_date)`` is ``current``."""
+    # Only rows of different files ingested the same day compete: the latest posting wins, then the greatest
+    # source, exports being named by date. Otherwise the newer write wins, even if upstream moved ``opened`` back.
+    current_opened, current_source, current_injection_date = current
+    if injection_date != current_injection_date or (source or "") == (current_source or ""):
+        return True
+    return (opened, source or "") >= (current_opened, current_source or "")
+
+
+def _supersedes(incoming: str, current: str) -> str:
+    # SQL counterpart of ``supersedes``
+    return (
+        f"({incoming}.injection_date IS DISTINCT FROM {current}.injection_date "
+        f"OR COALESCE({incoming}.source, '') = COALESCE({current}.source, '') "
+        f"OR {_precedence(incoming)} >= {_precedence(current)})"
+    )
+
+
+def _precedence(table: str) -> str:
+    # The "C" collation compares like Python strings
+    return f"({table}.opened, COALESCE({table}.source, '') COLLATE \"C\")"
+
+
+@dataclass
+class IngestionResult:
+    path: str
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    superseded: int = 0
+    rejected: int = 0
+    resumed_from: int = 0
+    rejects_path: str | None = None
+
+
+def ingest(
+    path: str,
+    chunksize: int,
+    *,
+    bulk: bool = False,
+    restart: bool = False,
+    rejects_dir: str | None = None,
+    progress: bool = False,
+) -> IngestionResult:
+    """Ingest the export at ``path`` chunk by chunk, resuming from its checkpoint and reporting rejected rows."""
+    injection_date = datetime.date.today()
+
+    fingerprint = file_fingerprint(path)
+    checkpoint, _ = IngestionCheckpoint.objects.get_or_create(source=str(Path(path).resolve()))
+    if checkpoint.rows and checkpoint.fingerprint != fingerprint and not restart:
+        logger.warning(f"{path} was replaced since it was partially ingested; ingesting it from the start")
+    if restart or checkpoint.fingerprint != fingerprint:
+        checkpoint.rows = 0
+        checkpoint.fingerprint = fingerprint
+
+    offset = checkpoint.rows
+    if offset:
+        logger.info(f"Resuming {path} from row {offset}")
+
+    rejects_path = os.path.join(rejects_dir, f"{Path(path).name}.rejects.csv") if rejects_dir else f"{path}.rejects.csv"
+    rejects = RejectReport(path=rejects_path, append=bool(offset))
+    result = IngestionResult(path=path, resumed_from=offset)
+    bar = tqdm(initial=offset, unit="row", desc=Path(path).name) if progress else None
+
+    for frame in read_frames(path=path, chunksize=chunksize, skip=offset):
+        data, rejected = normalize(frame=frame, source=path, injection_date=injection_date)
+        rejects.extend(rejected)
+
+        # The checkpoint commits with its chunk, so an interrupted run resumes right after it
+        with transaction.atomic():
+            created, updated, unchanged, superseded = write(data=data, rejects=rejects, bulk=bulk)
+            offset += len(frame)
+            checkpoint.rows = offset
+            checkpoint.save(update_fields=["rows", "fingerprint", "updated_at"])
+
+        result.created += created
+        result.updated += updated
+        result.unchanged += unchanged
+        result.superseded += superseded
+        if bar is not None:
+            bar.update(len(frame))
+
+    if bar is not None:
+        bar.close()
+    rejects.close()
+    checkpoint.delete()
+    if result.created or result.updated:
+        refresh_corpus_stats()
+
+    result.rejected = rejects.count
+    result.rejects_path = rejects.path if rejects.count else None
+    return result
+
+
+def file_fingerprint(path: str) -> str:
+    """Size and modification time of ``path``, which change when a new export replaces it."""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def write(data: pd.DataFrame, rejects: RejectReport, bulk: bool) -> tuple[int, int, int, int]:
+    """Write a normalized chunk with ``bulk_upsert`` or row by row, recording failed rows in ``rejects``."""
+    if bulk:
+        try:
+            with transaction.atomic():
+                return bulk_upsert(data)
+        except DatabaseError:
+            # Fall back to row-by-row writes so that only the offending rows are rejected
+            logger.warning(f"Bulk upsert failed for rows {data.index.min()}-{data.index.max()}; writing row by row")
+
+    # Rows superseded by the stored ones are skipped, as in ``bulk_upsert``
+    stored = {
+        identifier: current
+        for identifier, *current in Opportunity.objects.filter(id__in=list(data["id"])).values_list(
+            "id", "opened", "source", "injection_date"
+        )
+    }
+
+    n_created, n_updated, n_superseded = 0, 0, 0
+    for position, values in zip(data.index, to_records(data)):
+        identifier = values.pop("id")
+        values.pop("content_hash")  # Recomputed by Opportunity.save(), which also resets `vectorized` on change
+
+        key = uuid.UUID(identifier)
+        if key in stored and not supersedes(values["opened"], values["source"], values["injection_date"], stored[key]):
+            n_superseded += 1
+            continue
+
+        try:
+            opportunity, created = Opportunity.objects.update_or_create(id=identifier, defaults=values)
+        except Exception as exc:  # pylint: disable=too-broad-exception
+            rejects.add(row=position, identifier=identifier, error=exc)
+            continue
+
+        stored[key] = (values["opened"], values["source"], values["injection_date"])
+        if created:
+            n_created += 1
+        else:
+            n_updated += 1
+
+    # Row by row, unchanged Grants are saved again and counted as updated
+    return n_created, n_updated, 0, n_superseded
+
+
+@dataclass
+class IngestionDiff:
+    new: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    stale: int = 0
+    duplicated: int = 0
+    rejected: int = 0
+    changed_fields: Counter = field(default_factory=Counter)
+    samples: dict[str, list[str]] = field(default_factory=dict)
+
+
+def load_existing() -> pd.DataFrame:
+    """Load the key and compared values of every stored opportunity with a single query, indexed by ``key``."""
+    rows = Opportunity.objects.values_list("id", *DIFF_FIELDS, "injection_date").iterator(chunk_size=50_000)
+    existing = pd.DataFrame.from_records(rows, columns=["id", *DIFF_FIELDS, "injection_date"])
+    existing.index = _key(existing["id"].astype(str))
+    return existing.drop(columns="id")
+
+
+def compare(data: pd.DataFrame, existing: pd.DataFrame) -> pd.DataFrame:
+    """Status and ``changed`` fields of every row of ``data`` against ``load_existing()``."""
+    merged = data[["id", *DIFF_FIELDS, "injection_date"]].merge(
+        existing, how="left", left_on=_key(data["id"]), right_index=True, suffixes=("", "_current"), indicator=True
+    )
+    new = merged["_merge"] == "left_only"
+
+    changes = pd.DataFrame(index=merged.index)
+    for name in DIFF_FIELDS:
+        incoming, current = merged[name].astype(object), merged[f"{name}_current"].astype(object)
+        same = (incoming == current) | (incoming.isna() & current.isna())
+        # ``content`` stands for every field that makes up describe()
+        changes["content" if name == "content_hash" else name] = ~same & ~new
+
+    changed = changes.any(axis=1)
+    # Mirrors ``supersedes``: only another file ingested the same day can hold a later posting back
+    source, current_source = merged["source"].fillna(""), merged["source_current"].fillna("")
+    competing = (merged["injection_date"] == merged["injection_date_current"]) & (source != current_source)
+    superseded = (merged["opened"] < merged["opened_current"]) | (
+        (merged["opened"] == merged["opened_current"]) & (source < current_source)
+    )
+    stale = ~new & (competing & superseded).fillna(False).astype(bool)
+
+    status = np.select([new, stale, changed], ["new", "stale", "updated"], default="unchanged")
+    columns = np.array(changes.columns)
+    return pd.DataFrame(
+        {
+            "id": merged["id"],
+            "status": status,
+            "changed": [list(columns[row]) for row in changes.to_numpy()],
+        },
+        index=data.index,
+    )
+
+
+def dry_run(paths: list[str], chunksize: int, sample: int = 10) -> IngestionDiff:
+    """Diff ``paths`` against the stored Grants in memory, without writing anything."""
+    existing = load_existing()
+    injection_date = datetime.date.today()
+    result = IngestionDiff()
+    seen: set[str] = set()
+    sampled: dict[str, dict[str, Any]] = {}
+
+    for path in paths:
+        for frame in read_frames(path=path, chunksize=chunksize):
+            data, rejects = normalize(frame=frame, source=path, injection_date=injection_date)
+            result.rejected += len(rejects)
+
+            keys = _key(data["id"])
+            # Only the first occurrence of a repeated id is compared
+            first = ~keys.duplicated() & ~keys.isin(seen)
+            result.duplicated += int((~first).sum())
+            seen.update(keys[first])
+
+            diff = compare(data=data[first], existing=existing)
+            counts = diff["status"].value_counts()
+            for status in ("new", "updated", "unchanged", "stale"):
+                setattr(result, status, getattr(result, status) + int(counts.get(status, 0)))
+
+            updated = diff[diff["status"] == "updated"]
+            for position, identifier, changed in zip(updated.index, updated["id"], updated["changed"]):
+                result.changed_fields.update(changed)
+                if len(result.samples) < sample:
+                    result.samples[identifier] = changed
+                    if "content" in changed:
+                        [sampled[identifier]] = to_records(data.loc[[position], list(DESCRIBED_FIELDS)])
+
+    _explain_content(samples=result.samples, incoming=sampled)
+    return result
+
+
+def _explain_content(samples: dict[str, list[str]], incoming: dict[str, dict[str, Any]]) -> None:
+    # Replace ``content`` with the describe() fields that changed, fetching the sampled rows in one query
+    if not incoming:
+        return
+
+    identifiers = {uuid.UUID(identifier): identifier for identifier in incoming}
+    for values in Opportunity.objects.filter(id__in=list(identifiers)).values("id", *DESCRIBED_FIELDS):
+        identifier = identifiers[values["id"]]
+        fields = [name for name in DESCRIBED_FIELDS if incoming[identifier][name] != values[name]]
+        changed = samples[identifier]
+        changed[changed.index("content") : changed.index("content") + 1] = fields
+
+
+def _key(ids: pd.Series) -> pd.Series:
+    # Exports may spell UUIDs in upper case or without dashes
+    return ids.str.replace("-", "", regex=False).str.lower()
+
+
+def _to_copy_buffer(frame: pd.DataFrame) -> io.StringIO:
+    data = frame[UPSERT_FIELDS].copy()
+    data["categories"] = data["categories"].map(_array_literal, na_action="ignore")
+
+    buffer = io.StringIO()
+    data.to_csv(buffer, header=False, index=True, na_rep=COPY_NULL)
+    buffer.seek(0)
+    return buffer
+
+
+def _array_literal(values: list[str]) -> str:
+    items = (str(value).replace("\\", "\\\\").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'"{item}"' for item in items) + "}"
@@ -0,0 +1,241 @@
+import logging
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from opportunity.models import Opportunity, OpportunityChunk
+from utils.vector_db import MAX_EF_SEARCH, PRECISIONS, maximal_marginal_relevance, search_params, vector_literal
+
+logger = logging.getLogger(__name__)
+
+
+def nearest_opportunities(
+    embedding: Sequence[float],
+    k: int,
+    limit: int,
+    funding: bool | None = None,
+    open_only: bool = False,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> list[Opportunity]:
+    """Up to ``limit`` opportunities ranked by their closest of the ``k`` chunks nearest to ``embedding``."""
+    chunks, params, candidates = _nearest_chunks(embedding, k, conditions=_conditions(funding, open_only))
+    sql = (
+        f"SELECT o.*, nearest.distance FROM ("
+        f"SELECT opportunity_id, min(distance) AS distance FROM ({chunks}) candidates GROUP BY opportunity_id"
+        f") nearest JOIN {Opportunity._meta.db_table} o ON o.id = nearest.opportunity_id "
+        f"ORDER BY nearest.distance LIMIT %s"
+    )
+
+    with _scan(candidates, ef_search, probes):
+        return list(Opportunity.objects.raw(sql, [*params, limit]))
+
+
+def diverse_opportunities(
+    embedding: Sequence[float],
+    k: int,
+    limit: int,
+    funding: bool | None = None,
+    open_only: bool = False,
+    lambda_mult: float = 0.3,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> list[Opportunity]:
+    """Up to ``limit`` distinct opportunities in MMR order of the ``k`` chunks nearest to ``embedding``."""
+    # A single scan fetches the chunks with their vectors; MMR then runs in-process
+    sql, params, candidates = _nearest_chunks(embedding, k, conditions=_conditions(funding, open_only))
+    with _scan(candidates, ef_search, probes):
+        chunks = list(OpportunityChunk.objects.raw(sql, params))
+
+    distances: dict = {}
+    for chunk in chunks:
+        distances[chunk.opportunity_id] = min(chunk.distance, distances.get(chunk.opportunity_id, chunk.distance))
+
+    ids = []
+    for index in maximal_marginal_relevance(embedding, [chunk.embedding for chunk in chunks], lambda_mult):
+        if chunks[index].opportunity_id not in ids:
+            ids.append(chunks[index].opportunity_id)
+        if len(ids) == limit:
+            break
+
+    opportunities = Opportunity.objects.in_bulk(ids)
+    for identifier, opportunity in opportunities.items():
+        opportunity.distance = distances[identifier]
+    return [opportunities[identifier] for identifier in ids]
+
+
+def adaptive_opportunities(
+    embedding: Sequence[float],
+    limit: int,
+    k: int,
+    max_k: int,
+    funding: bool | None = None,
+    open_only: bool = False,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> list[Opportunity]:
+    """Like ``nearest_opportunities``, doubling ``k`` up to ``max_k`` while fewer than ``limit`` are found."""
+    conditions = _conditions(funding, open_only)
+    while True:
+        sql, params, candidates = _nearest_chunks(embedding, k, conditions=conditions, vectors=False)
+        with _scan(candidates, ef_search, probes), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        # Rows come closest first, so the first distance seen for an opportunity is its smallest
+        distances: dict = {}
+        for _, opportunity_id, distance in rows:
+            distances.setdefault(opportunity_id, distance)
+        if len(distances) >= limit or k >= max_k:
+            break
+        logger.debug(f"{len(distances)} of {limit} opportunities among {k} chunks, expanding")
+        k = min(k * 2, max_k)
+
+    ids = list(distances)[:limit]
+    opportunities = Opportunity.objects.in_bulk(ids)
+    for identifier, opportunity in opportunities.items():
+        opportunity.distance = distances[identifier]
+    return [opportunities[identifier] for identifier in ids]
+
+
+def lexical_opportunity_ids(text: str, limit: int, funding: bool | None = None, open_only: bool = False) -> list:
+    """Ids of up to ``limit`` opportunities best matching ``text`` by full-text search."""
+    where = "".join(f" AND {condition}" for condition in _conditions(funding, open_only))
+    # The plain query ANDs every term; OR-ing them keeps partial matches, ranked by how much they cover
+    query = "replace(plainto_tsquery('english', %s)::text, ' & ', ' | ')::tsquery"
+    sql = (
+        f"SELECT id FROM {Opportunity._meta.db_table}, {query} query "
+        f"WHERE search_vector @@ query{where} "
+        f"ORDER BY ts_rank_cd(search_vector, query) DESC, id LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [text, limit])
+        return [identifier for (identifier,) in cursor.fetchall()]
+
+
+def hybrid_opportunities(
+    text: str,
+    embedding: Sequence[float],
+    k: int,
+    limit: int,
+    funding: bool | None = None,
+    open_only: bool = False,
+    candidates: int = 20,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> list[Opportunity]:
+    """Up to ``limit`` opportunities by reciprocal rank fusion of the lexical and nearest rankings."""
+    # The lexical and vector queries run concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        lexical = executor.submit(_in_own_connection, lexical_opportunity_ids, text, candidates, funding, open_only)
+        nearest = executor.submit(
+            _in_own_connection, nearest_opportunities, embedding, k, candidates, funding, open_only, ef_search, probes
+        )
+        rankings = [lexical.result(), [opportunity.id for opportunity in nearest.result()]]
+
+    ids = reciprocal_rank_fusion(rankings)[:limit]
+    distances = {opportunity.id: opportunity.distance for opportunity in nearest.result()}
+    distances.update(_closest_distances(embedding, [identifier for identifier in ids if identifier not in distances]))
+
+    opportunities = Opportunity.objects.in_bulk(ids)
+    for identifier, opportunity in opportunities.items():
+        opportunity.distance = distances.get(identifier)
+    return [opportunities[identifier] for identifier in ids]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], constant: int = 60) -> list:
+    """Items of ``rankings`` ordered by the sum of ``1 / (constant + rank)`` over the rankings they appear in."""
+    scores: dict = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1 / (constant + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)
+
+
+def nearest_chunk_ids(
+    embedding: Sequence[float],
+    k: int,
+    precision: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> list[str]:
+    """Ids of the ``k`` chunks nearest to ``embedding``, closest first, searched at ``precision``."""
+    sql, params, candidates = _nearest_chunks(embedding, k, precision=precision)
+    with _scan(candidates, ef_search, probes):
+        return [str(chunk.id) for chunk in OpportunityChunk.objects.raw(sql, params)]
+
+
+def _scan(candidates: int, ef_search: int | None, probes: int | None):
+    # An HNSW scan returns at most ef_search rows, so it should cover every candidate, up to the largest value pgvector
+    # accepts; the filters drop rows after the scan, which goes on iteratively until enough of them pass
+    return search_params(
+        ef_search=min(max(candidates, ef_search or settings.VECTOR_EF_SEARCH), MAX_EF_SEARCH),
+        probes=probes or settings.VECTOR_PROBES,
+        iterative_scan=settings.VECTOR_ITERATIVE_SCAN,
+    )
+
+
+def _in_own_connection(function, *args):
+    # Worker threads open their own database connection, which must not outlive them
+    try:
+        return function(*args)
+    finally:
+        connection.close()
+
+
+def _closest_distances(embedding: Sequence[float], ids: Sequence) -> dict:
+    if not ids:
+        return {}
+    sql = (
+        f"SELECT opportunity_id, min(embedding <=> %s::vector) FROM {OpportunityChunk._meta.db_table} "
+        f"WHERE opportunity_id = ANY(%s) GROUP BY opportunity_id"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [vector_literal(embedding), list(ids)])
+        return dict(cursor.fetchall())
+
+
+def _conditions(funding: bool | None, open_only: bool = False) -> list[str]:
+    # Plain predicates on columns shared by the opportunity and chunk tables, each backed by an index
+    conditions = []
+    if funding is not None:
+        conditions.append(f"funding IS {'NOT ' if funding else ''}NULL")
+    if open_only:
+        conditions.append("(closed IS NULL OR closed >= CURRENT_DATE)")
+        conditions.append("(archived IS NULL OR archived > CURRENT_DATE)")
+    return conditions
+
+
+def _nearest_chunks(
+    embedding: Sequence[float],
+    k: int,
+    conditions: Sequence[str] = (),
+    precision: str | None = None,
+    vectors: bool = True,
+) -> tuple[str, list, int]:
+    """SQL of the ``k`` chunks nearest to ``embedding``, its parameters and the candidates the index returns."""
+    precision = precision or settings.VECTOR_PRECISION
+    table, vector = OpportunityChunk._meta.db_table, vector_literal(embedding)
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    exact = "embedding <=> %s::vector"
+    columns = "id, opportunity_id, embedding" if vectors else "id, opportunity_id"
+
+    if precision == "full":
+        # A relaxed iterative scan may return rows slightly out of order, so they are sorted again
+        sql = (
+            f"SELECT * FROM (SELECT {columns}, {exact} AS distance FROM {table} {where}"
+            f"ORDER BY {exact} LIMIT %s) nearest ORDER BY distance"
+        )
+        return sql, [vector, vector, k], k
+
+    # The index finds more candidates on the reduced vectors, rescored with the full-precision ones
+    candidates = k * settings.VECTOR_RERANK_FACTOR
+    sql = (
+        f"SELECT {columns}, {exact} AS distance FROM ("
+        f"SELECT id, opportunity_id, embedding FROM {table} {where}"
+        f"ORDER BY {PRECISIONS[precision].distance('embedding', '%s::vector')} LIMIT %s"
+        f") reduced ORDER BY distance LIMIT %s"
+    )
+    return sql, [vector, vector, candidates, k], candidates
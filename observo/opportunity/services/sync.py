@@ -0,0 +1,159 @@
+import datetime
+import logging
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any
+
+import pandas as pd
+import requests
+
+from opportunity.models import SyncCursor
+from opportunity.services.corpus import refresh_corpus_stats
+from opportunity.services.ingestion import MODEL_CSV_MAPPING, RejectReport, normalize, write
+
+logger = logging.getLogger(__name__)
+
+
+class GrantsClient:
+    """Client for the paginated JSON listing of opportunities at ``GRANTS_API_URL``."""
+
+    # ``GET url?page=&page_size=&modified_since=`` answers ``{"data": [...], "pagination_info": {"total_pages": n}}``,
+    # records carrying the export columns at the top level or under ``summary``, plus ``updated_at``
+
+    def __init__(self, url: str, api_key: str | None = None, page_size: int = 100, timeout: int = 30) -> None:
+        self.url = url
+        self.page_size = page_size
+        self.timeout = timeout
+        self.headers = {"Accept": "application/json"}
+        if api_key:
+            self.headers["X-API-Key"] = api_key
+
+    def page(self, number: int, since: datetime.datetime | None = None) -> dict[str, Any]:
+        params = {"page": number, "page_size": self.page_size}
+        if since is not None:
+            params["modified_since"] = since.isoformat()
+
+        response = requests.get(self.url, params=params, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def pages(self, since: datetime.datetime | None = None, workers: int = 4) -> Iterator[tuple[int, dict[str, Any]]]:
+        """Yield ``(number, page)`` pairs, fetching every page after the first concurrently, in completion order."""
+        first = self.page(1, since=since)
+        yield 1, first
+
+        total = int(first.get("pagination_info", {}).get("total_pages") or 1)
+        if total <= 1:
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self.page, number, since): number for number in range(2, total + 1)}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+
+def to_frame(records: list[dict[str, Any]], offset: int = 0) -> pd.DataFrame:
+    """Lay out API records like a raw export chunk so that they go through the same ``normalize`` as ``inject``."""
+    rows = []
+    for record in records:
+        values = {**record, **(record.get("summary") if isinstance(record.get("summary"), dict) else {})}
+        rows.append({column: _as_raw(values.get(column)) for column in MODEL_CSV_MAPPING.values()})
+
+    frame = pd.DataFrame(rows, columns=list(MODEL_CSV_MAPPING.values()), dtype=object)
+    frame.index = pd.RangeIndex(offset, offset + len(frame))
+    return frame
+
+
+def _as_raw(value: Any) -> str | None:
+    if value is None or value == "":
+        return None
+    if isinstance(value, list):
+        return ";".join(str(item) for item in value)
+    return str(value)
+
+
+def _stamps(records: list[dict[str, Any]], index: pd.Index) -> pd.Series:
+    # Modification times of ``records``, indexed like their ``to_frame`` rows
+    stamps = pd.Series([record.get("updated_at") for record in records], index=index, dtype=object)
+    return pd.to_datetime(stamps, errors="coerce", utc=True)
+
+
+def _next_cursor(accepted: pd.Series, rejected: pd.Series) -> datetime.datetime | None:
+    """Latest modification time of the ``accepted`` records older than every ``rejected`` one, which stay to sync."""
+    if rejected.notna().any():
+        accepted = accepted[accepted < rejected.min()]
+    return None if accepted.isna().all() else accepted.max().to_pydatetime()
+
+
+class _FailedRows(RejectReport):
+    """Rows ``write`` could not store, logged rather than reported, whose positions hold the cursor back."""
+
+    def __init__(self) -> None:
+        super().__init__(path="")
+        self.rows: list[int] = []
+
+    def add(self, row: int, identifier: Any, error: Exception | str) -> None:
+        logger.warning(f"Failed to write {identifier} (row {row}): {str(error).strip()}")
+        self.rows.append(row)
+        self.count += 1
+
+
+@dataclass
+class SyncResult:
+    source: str
+    since: datetime.datetime | None = None
+    cursor: datetime.datetime | None = None
+    pages: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    superseded: int = 0
+    rejected: int = 0
+
+
+def sync(client: GrantsClient, *, workers: int = 4, full: bool = False) -> SyncResult:
+    """Upsert the opportunities modified since the stored cursor of ``client.url`` and move the cursor on."""
+    cursor, _ = SyncCursor.objects.get_or_create(source=client.url)
+    since = None if full else cursor.cursor
+    result = SyncResult(source=client.url, since=since, cursor=cursor.cursor)
+    injection_date = datetime.date.today()
+    accepted, rejected = [], []
+
+    for number, page in client.pages(since=since, workers=workers):
+        records = page.get("data") or []
+        frame = to_frame(records=records, offset=(number - 1) * client.page_size)
+        data, rejects = normalize(frame=frame, source=client.url, injection_date=injection_date)
+        for row, identifier, error in rejects.itertuples(index=False):
+            logger.warning(f"Rejected {identifier} (page {number}, row {row}): {error}")
+
+        # Rows the database refuses are rejected one by one instead of failing the page
+        failed = _FailedRows()
+        created, updated, unchanged, superseded = write(data=data, rejects=failed, bulk=True)
+        result.pages += 1
+        result.created += created
+        result.updated += updated
+        result.unchanged += unchanged
+        result.superseded += superseded
+        result.rejected += len(rejects) + failed.count
+
+        stamps = _stamps(records=records, index=frame.index)
+        kept = stamps.index.isin(data.index) & ~stamps.index.isin(failed.rows)
+        accepted.append(stamps[kept])
+        rejected.append(stamps[~kept])
+
+    # The cursor only moves once every page is written, and never past a rejected Grant, fetched again next time
+    latest = _next_cursor(accepted=pd.concat(accepted), rejected=pd.concat(rejected))
+    if latest is not None and (result.cursor is None or latest > result.cursor):
+        result.cursor = latest
+
+    if result.cursor != cursor.cursor:
+        cursor.cursor = result.cursor
+        cursor.save(update_fields=["cursor", "updated_at"])
+    if result.created or result.updated:
+        refresh_corpus_stats()
+    return result
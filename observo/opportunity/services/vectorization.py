@@ -0,0 +1,74 @@
+import logging
+from collections.abc import Callable
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TextSplitter
+
+from opportunity.models import Opportunity, OpportunityChunk
+from opportunity.services.corpus import bump_corpus_version
+from utils.vector_db import chunk_id
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 150
+
+
+def default_splitter() -> TextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def pending_opportunities() -> QuerySet[Opportunity]:
+    """Opportunities still to vectorize, one per title, ordered by title."""
+    # The open and latest posted Grant represents its title, as closed and archived chunks are never retrieved
+    return (
+        Opportunity.objects.exclude(vectorized=True)
+        .order_by(
+            "title",
+            F("closed").desc(nulls_first=True),
+            F("archived").desc(nulls_first=True),
+            F("opened").desc(),
+            "id",
+        )
+        .distinct("title")
+    )
+
+
+def mark_title_duplicates(opportunities: list[Opportunity]) -> None:
+    # Other Grants sharing a title are represented by the vectorized one
+    titles = [opportunity.title for opportunity in opportunities]
+    Opportunity.objects.filter(title__in=titles).exclude(vectorized=True).update(vectorized=True)
+
+
+def vectorize_opportunities(
+    opportunities: list[Opportunity], splitter: TextSplitter, embed: Callable[[list[str]], list[list[float]]]
+) -> tuple[int, int]:
+    """Replace the chunks of ``opportunities``, returning the number of inserted and deleted ones."""
+    chunks: dict[str, OpportunityChunk] = {}
+    for opportunity in opportunities:
+        filters = {field: getattr(opportunity, field) for field in OpportunityChunk.FILTER_FIELDS}
+        for index, text in enumerate(splitter.split_text(opportunity.describe())):
+            identifier = chunk_id(str(opportunity.id), index, text)
+            chunks[identifier] = OpportunityChunk(
+                id=identifier, opportunity=opportunity, index=index, text=text, **filters
+            )
+
+    # Chunks already stored under the same id are kept, so only new ones are embedded
+    owners = [opportunity.id for opportunity in opportunities]
+    stored = {
+        str(identifier)
+        for identifier in OpportunityChunk.objects.filter(opportunity_id__in=owners).values_list("id", flat=True)
+    }
+    new = [chunk for identifier, chunk in chunks.items() if identifier not in stored]
+    for chunk, vector in zip(new, embed([chunk.text for chunk in new]) if new else []):
+        chunk.embedding = vector
+
+    with transaction.atomic():
+        deleted, _ = OpportunityChunk.objects.filter(opportunity_id__in=owners).exclude(id__in=list(chunks)).delete()
+        OpportunityChunk.objects.bulk_create(new, batch_size=500)
+        Opportunity.objects.filter(id__in=owners).update(vectorized=True)
+        if new or deleted:
+            bump_corpus_version()
+
+    return len(new), deleted
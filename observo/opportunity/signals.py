@@ -0,0 +1,30 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from opportunity.models import Opportunity, OpportunityChunk
+from opportunity.services.corpus import bump_corpus_version
+
+
+@receiver(post_save, sender=Opportunity)
+def copy_filter_fields(sender, instance: Opportunity, **kwargs) -> None:
+    # Chunks carry copies of the filter columns; matches cached under the former values must not be served
+    values = {field: getattr(instance, field) for field in OpportunityChunk.FILTER_FIELDS}
+    outdated = reduce(or_, (_differs(field, value) for field, value in values.items()))
+    if OpportunityChunk.objects.filter(outdated, opportunity=instance).update(**values):
+        bump_corpus_version()
+
+
+@receiver(post_delete, sender=Opportunity)
+def invalidate_matches(sender, instance: Opportunity, **kwargs) -> None:
+    # Its chunks were deleted along with it
+    bump_corpus_version()
+
+
+def _differs(field: str, value) -> Q:
+    if value is None:
+        return Q(**{f"{field}__isnull": False})
+    return Q(**{f"{field}__isnull": True}) | ~Q(**{field: value})
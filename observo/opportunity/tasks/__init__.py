@@ -0,0 +1,7 @@
+from opportunity.tasks.vectorize import finish_vectorization, vectorize_grants, vectorize_shard
+
+__all__ = [
+    "vectorize_grants",
+    "vectorize_shard",
+    "finish_vectorization",
+]
@@ -0,0 +1,100 @@
+import logging
+from datetime import timedelta
+
+from celery import chord, shared_task
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from opportunity.models import Opportunity, VectorizationRun
+from opportunity.services.corpus import refresh_corpus_stats
+from opportunity.services.vectorization import (
+    default_splitter,
+    mark_title_duplicates,
+    pending_opportunities,
+    vectorize_opportunities,
+)
+from utils.embeddings import EmbeddingPipeline
+from utils.vector_db import embeddings
+
+logger = logging.getLogger(__name__)
+
+# Key of the advisory lock that lets a single trigger at a time plan a run
+VECTORIZATION_LOCK = 0x766563
+
+
+@shared_task(name="vectorize_grants")
+def vectorize_grants(shard_size: int = 200) -> int | None:
+    # Concurrent triggers (e.g. inject and sync) queue up here, so only one of them plans a run
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [VECTORIZATION_LOCK])
+
+        # Runs older than the task time limit were abandoned by their workers
+        started_after = timezone.now() - timedelta(seconds=settings.CELERY_TASK_TIME_LIMIT)
+        running = VectorizationRun.objects.filter(finished_at__isnull=True, created_at__gte=started_after).first()
+        if running:
+            logger.info(f"{running} is still running; it queues another run for the Grants changed meanwhile")
+            return None
+
+        ids = [str(pk) for pk in pending_opportunities().values_list("id", flat=True)]
+        if not ids:
+            logger.info("No Grants left to vectorize")
+            return None
+
+        shards = [ids[start : start + shard_size] for start in range(0, len(ids), shard_size)]
+        run = VectorizationRun.objects.create(total=len(ids), shards=len(shards))
+        logger.info(f"Vectorizing {len(ids)} Grants in {len(shards)} shards (run #{run.pk})")
+
+        # Workers must find the run, so the tasks are only sent once it is committed
+        transaction.on_commit(
+            lambda: chord(vectorize_shard.s(run.pk, shard) for shard in shards)(
+                finish_vectorization.s(run.pk, shard_size)
+            )
+        )
+    return run.pk
+
+
+@shared_task(name="vectorize_shard")
+def vectorize_shard(run_pk: int, ids: list[str]) -> None:
+    # Grants vectorized since the run was planned are skipped
+    opportunities = list(Opportunity.objects.filter(id__in=ids).exclude(vectorized=True))
+    cache = embeddings()
+    pipeline = EmbeddingPipeline(embeddings=cache.embeddings)
+
+    try:
+        inserted, deleted = vectorize_opportunities(
+            opportunities,
+            splitter=default_splitter(),
+            embed=lambda texts: cache.embed_documents(texts, embed=pipeline.embed),
+        )
+        mark_title_duplicates(opportunities)
+    except Exception as exc:  # pylint: disable=too-broad-exception
+        # The chord still finishes; these Grants stay unvectorized for the next run
+        logger.exception(f"Vectorization run #{run_pk} failed for {len(ids)} Grants")
+        VectorizationRun.objects.filter(pk=run_pk).update(
+            failed=F("failed") + len(ids), error=str(exc), updated_at=timezone.now()
+        )
+        return
+
+    VectorizationRun.objects.filter(pk=run_pk).update(
+        done=F("done") + len(ids),
+        chunks=F("chunks") + inserted,
+        deleted=F("deleted") + deleted,
+        updated_at=timezone.now(),
+    )
+
+
+@shared_task(name="finish_vectorization")
+def finish_vectorization(_: list, run_pk: int, shard_size: int = 200) -> None:
+    run = VectorizationRun.objects.get(pk=run_pk)
+    run.finished_at = timezone.now()
+    run.save(update_fields=["finished_at", "updated_at"])
+    refresh_corpus_stats()
+    logger.info(f"{run} finished: {run.chunks} chunks stored, {run.failed} Grants failed")
+
+    # Triggers dropped while this run was going on; Grants of failed shards wait for the next trigger instead
+    if Opportunity.objects.exclude(vectorized=True).filter(updated_at__gte=run.created_at).exists():
+        logger.info(f"Grants changed during {run}, queueing another run")
+        vectorize_grants.delay(shard_size=shard_size)
@@ -0,0 +1,516 @@
+import csv
+import datetime
+import io
+import os
+import tempfile
+import uuid
+import warnings
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+import faker
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from ddt import data, ddt, unpack
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from opportunity.models import IngestionCheckpoint, Opportunity, OpportunityChunk
+from opportunity.services.corpus import corpus_version
+from opportunity.services.ingestion import (
+    COPY_NULL,
+    DIFF_FIELDS,
+    MODEL_CSV_MAPPING,
+    UPSERT_FIELDS,
+    IngestionResult,
+    _to_copy_buffer,
+    bulk_upsert,
+    compare,
+    file_fingerprint,
+    ingest,
+    normalize,
+    read_frames,
+    to_records,
+    write,
+)
+
+fake = faker.Faker()
+
+
+def _row(**overrides: str | None) -> dict[str, str | None]:
+    row = {
+        "opportunity_id": fake.uuid4(),
+        "opportunity_number": fake.bothify("??-###"),
+        "opportunity_title": fake.sentence(),
+        "agency_code": "HHS-NIH11",
+        "agency_name": "National Institutes of Health",
+        "top_level_agency_name": "Department of Health and Human Services",
+        "funding_categories": "health;science_technology_and_other_research_and_development",
+        "post_date": "2025-01-15",
+        "close_date": "2025-03-01",
+        "close_date_description": None,
+        "archive_date": None,
+        "expected_number_of_awards": "4",
+        "award_ceiling": "250000.0",
+        "additional_info_url": None,
+        "applicant_eligibility_description": None,
+        "summary_description": fake.paragraph(),
+    }
+    row.update(overrides)
+    return row
+
+
+def _frame(
+    *rows: dict, source: str = "export.csv", injection_date: datetime.date = datetime.date(2025, 2, 1)
+) -> pd.DataFrame:
+    frame = pd.DataFrame(list(rows), columns=list(MODEL_CSV_MAPPING.values()), dtype=object)
+    valid, _ = normalize(frame=frame, source=source, injection_date=injection_date)
+    return valid
+
+
+@ddt
+class TestNormalize(SimpleTestCase):
+    def setUp(self):
+        self.injection_date = datetime.date(2025, 2, 1)
+
+    def _normalize(self, *rows: dict) -> tuple[pd.DataFrame, pd.DataFrame]:
+        frame = pd.DataFrame(list(rows), columns=list(MODEL_CSV_MAPPING.values()), dtype=object)
+        return normalize(frame=frame, source="export.csv", injection_date=self.injection_date)
+
+    def test_normalize_success(self) -> None:
+        row = _row()
+        valid, rejects = self._normalize(row)
+
+        self.assertTrue(rejects.empty)
+        self.assertEqual(list(valid.columns), UPSERT_FIELDS)
+
+        [record] = to_records(valid)
+        self.assertEqual(record["id"], row["opportunity_id"])
+        self.assertEqual(record["categories"], ["health", "science_technology_and_other_research_and_development"])
+        self.assertEqual(record["opened"], datetime.date(2025, 1, 15))
+        self.assertEqual(record["closed"], datetime.date(2025, 3, 1))
+        self.assertIsNone(record["archived"])
+        self.assertEqual(record["awards"], 4)
+        self.assertEqual(record["funding"], 250000)
+        self.assertEqual(record["source"], "export.csv")
+        self.assertEqual(record["injection_date"], self.injection_date)
+
+    def test_content_hash_matches_model(self) -> None:
+        valid, _ = self._normalize(_row(), _row(award_ceiling=None, funding_categories=None))
+
+        for record in to_records(valid):
+            opportunity = Opportunity(**record)
+            self.assertEqual(record["content_hash"], opportunity.compute_content_hash())
+
+    def test_content_hash_ignores_the_source(self) -> None:
+        row = _row()
+
+        [first] = to_records(_frame(row, source="exports/2025-01.csv"))
+        [second] = to_records(_frame(row, source="/data/renamed.csv"))
+
+        self.assertEqual(first["content_hash"], second["content_hash"])
+        self.assertNotIn("renamed", Opportunity(**second).describe())
+
+    def test_missing_optional_values_become_none(self) -> None:
+        valid, rejects = self._normalize(_row(funding_categories=None, award_ceiling=None, close_date=None))
+
+        self.assertTrue(rejects.empty)
+        [record] = to_records(valid)
+        self.assertIsNone(record["categories"])
+        self.assertIsNone(record["funding"])
+        self.assertIsNone(record["closed"])
+
+    def test_missing_id_is_only_reported_as_missing(self) -> None:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", FutureWarning)
+            _, rejects = self._normalize(_row(opportunity_id=None), _row(opportunity_id=None))
+
+        self.assertEqual(list(rejects["error"]), ["id is missing", "id is missing"])
+
+    @unpack
+    @data(
+        ({"opportunity_title": None}, "title is missing"),
+        ({"opportunity_id": "12345"}, "id is not a valid UUID"),
+        ({"post_date": "not a date"}, "opened is not a valid date"),
+        ({"expected_number_of_awards": "many"}, "awards is not an integer"),
+        ({"expected_number_of_awards": "40000"}, "awards is not an integer"),
+        ({"award_ceiling": "-1"}, "funding is not an integer"),
+        ({"agency_code": "X" * 256}, "code is longer than 255 characters"),
+    )
+    def test_invalid_rows_are_rejected(self, overrides: dict, error: str) -> None:
+        valid_row, invalid_row = _row(), _row(**overrides)
+        valid, rejects = self._normalize(valid_row, invalid_row)
+
+        self.assertEqual(list(valid["id"]), [valid_row["opportunity_id"]])
+        self.assertEqual(list(rejects["row"]), [1])
+        self.assertIn(error, rejects["error"].iloc[0])
+
+
+@ddt
+class TestCompare(SimpleTestCase):
+    def setUp(self):
+        frame = pd.DataFrame([_row()], columns=list(MODEL_CSV_MAPPING.values()), dtype=object)
+        self.stored, _ = normalize(frame=frame, source="export.csv", injection_date=datetime.date(2025, 2, 1))
+
+    def _existing(self) -> pd.DataFrame:
+        existing = self.stored[[*DIFF_FIELDS, "injection_date"]].copy()
+        existing.index = self.stored["id"].str.replace("-", "").str.lower()
+        return existing
+
+    def test_new_and_unchanged(self) -> None:
+        incoming = pd.concat([self.stored, self.stored.assign(id=fake.uuid4())], ignore_index=True)
+        incoming.loc[0, "injection_date"] = datetime.date(2025, 3, 1)
+
+        diff = compare(data=incoming, existing=self._existing())
+
+        self.assertEqual(list(diff["status"]), ["unchanged", "new"])
+        self.assertEqual(list(diff["changed"]), [[], []])
+
+    def test_ids_are_matched_regardless_of_spelling(self) -> None:
+        incoming = self.stored.assign(id=self.stored["id"].str.upper().str.replace("-", ""))
+
+        diff = compare(data=incoming, existing=self._existing())
+
+        self.assertEqual(list(diff["status"]), ["unchanged"])
+
+    @unpack
+    @data(
+        ({"link": "https://example.com"}, ["link"]),
+        ({"closed": datetime.date(2025, 4, 1)}, ["closed"]),
+        ({"content_hash": "0" * 64, "code": "NSF"}, ["code", "content"]),
+    )
+    def test_updated_fields(self, changes: dict, changed: list[str]) -> None:
+        diff = compare(data=self.stored.assign(**changes), existing=self._existing())
+
+        self.assertEqual(list(diff["status"]), ["updated"])
+        self.assertEqual(sorted(diff["changed"].iloc[0]), changed)
+
+    @unpack
+    @data(
+        ("older.csv", datetime.date(2025, 2, 1), "stale"),
+        ("export.csv", datetime.date(2025, 2, 1), "updated"),
+        ("older.csv", datetime.date(2025, 3, 1), "updated"),
+    )
+    def test_older_posting_is_stale_only_against_another_file_of_the_day(
+        self, source: str, injection_date: datetime.date, status: str
+    ) -> None:
+        incoming = self.stored.assign(opened=datetime.date(2024, 1, 1), source=source, injection_date=injection_date)
+
+        diff = compare(data=incoming, existing=self._existing())
+
+        self.assertEqual(list(diff["status"]), [status])
+
+    @unpack
+    @data(("a.csv", "stale"), ("z.csv", "updated"))
+    def test_same_day_postings_are_ordered_by_source(self, source: str, status: str) -> None:
+        diff = compare(data=self.stored.assign(source=source), existing=self._existing())
+
+        self.assertEqual(list(diff["status"]), [status])
+
+
+@ddt
+class TestReadFrames(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.rows = [_row(), _row(funding_categories=None, award_ceiling=None), _row(close_date=None), _row(), _row()]
+        frame = pd.DataFrame(self.rows)
+
+        frame.to_csv(self._path("export.csv"), index=False)
+        frame.to_csv(self._path("export.csv.gz"), index=False)
+        with zipfile.ZipFile(self._path("export.zip"), "w") as archive:
+            # Members are read in name order
+            archive.writestr("part-2.csv", frame.iloc[2:].to_csv(index=False))
+            archive.writestr("part-1.csv", frame.iloc[:2].to_csv(index=False))
+
+        # Columnar exports carry typed columns rather than strings
+        table = pa.table(
+            {
+                **{column: frame[column].tolist() for column in frame.columns},
+                "funding_categories": [value.split(";") if value else None for value in frame["funding_categories"]],
+                "post_date": pa.array(pd.to_datetime(frame["post_date"]).dt.date, pa.date32()),
+                "close_date": pa.array(pd.to_datetime(frame["close_date"]).dt.date, pa.date32()),
+                "expected_number_of_awards": pa.array(frame["expected_number_of_awards"].astype("Int64"), pa.int64()),
+                "award_ceiling": pa.array(frame["award_ceiling"].astype(float), pa.float64()),
+                "ignored_column": list(range(len(frame))),
+            }
+        )
+        pq.write_table(table, self._path("export.parquet"), row_group_size=2)
+        feather.write_feather(table, self._path("export.feather"), chunksize=2)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _normalized(self, name: str, chunksize: int = 2, skip: int = 0) -> pd.DataFrame:
+        frames = list(read_frames(self._path(name), chunksize=chunksize, skip=skip))
+        self.assertTrue(all(len(frame) <= chunksize for frame in frames))
+        valid, rejects = normalize(pd.concat(frames), source="export", injection_date=datetime.date(2025, 2, 1))
+        self.assertTrue(rejects.empty)
+        return valid
+
+    @data("export.csv.gz", "export.zip", "export.parquet", "export.feather")
+    def test_every_format_yields_the_same_rows(self, name: str) -> None:
+        expected = self._normalized("export.csv")
+
+        pd.testing.assert_frame_equal(self._normalized(name), expected)
+        self.assertEqual(list(expected["id"]), [row["opportunity_id"] for row in self.rows])
+
+    @data("export.csv", "export.csv.gz", "export.zip", "export.parquet", "export.feather")
+    def test_skip_resumes_across_chunks(self, name: str) -> None:
+        expected = self._normalized("export.csv").iloc[3:]
+
+        pd.testing.assert_frame_equal(self._normalized(name, skip=3), expected)
+
+
+class TestCopyBuffer(SimpleTestCase):
+    def test_nulls_newlines_and_arrays_are_escaped(self) -> None:
+        row = _row(
+            summary_description='Line one\nline "two", with a comma',
+            funding_categories='a "quoted";back\\slash;with, comma',
+            award_ceiling=None,
+        )
+
+        [record] = list(csv.reader(_to_copy_buffer(_frame(row))))
+
+        values = dict(zip(["position", *UPSERT_FIELDS], record))
+        self.assertEqual(values["position"], "0")
+        self.assertEqual(values["summary"], row["summary_description"])
+        self.assertEqual(values["categories"], '{"a \\"quoted\\"","back\\\\slash","with, comma"}')
+        self.assertEqual(values["funding"], COPY_NULL)
+        self.assertEqual(values["archived"], COPY_NULL)
+
+
+class TestBulkUpsert(TestCase):
+    def test_rows_are_created_updated_or_left_unchanged(self) -> None:
+        first, second = _row(), _row()
+
+        self.assertEqual(bulk_upsert(_frame(first)), (1, 0, 0, 0))
+        self.assertEqual(bulk_upsert(_frame(first, second)), (1, 0, 1, 0))
+        self.assertEqual(bulk_upsert(_frame(_row(**{**first, "close_date": "2025-04-01"}), second)), (0, 1, 1, 0))
+
+        self.assertEqual(Opportunity.objects.count(), 2)
+        self.assertEqual(Opportunity.objects.get(id=first["opportunity_id"]).closed, datetime.date(2025, 4, 1))
+
+    def test_values_survive_the_copy(self) -> None:
+        row = _row(
+            summary_description='Line one\nline "two", with a comma',
+            funding_categories='a "quoted";back\\slash;with, comma',
+            award_ceiling=None,
+        )
+
+        bulk_upsert(_frame(row))
+
+        opportunity = Opportunity.objects.get(id=row["opportunity_id"])
+        self.assertEqual(opportunity.summary, row["summary_description"])
+        self.assertEqual(opportunity.categories, ['a "quoted"', "back\\slash", "with, comma"])
+        self.assertIsNone(opportunity.funding)
+        self.assertEqual(opportunity.content_hash, opportunity.compute_content_hash())
+        self.assertFalse(opportunity.vectorized)
+
+    def test_repeated_ids_keep_the_latest_posting(self) -> None:
+        identifier = fake.uuid4()
+        rows = [
+            _row(opportunity_id=identifier, post_date="2025-01-20", opportunity_title="Latest"),
+            _row(opportunity_id=identifier, post_date="2025-01-10", opportunity_title="Oldest"),
+            _row(opportunity_id=identifier.upper(), post_date="2025-01-20", opportunity_title="Latest, last row"),
+        ]
+
+        self.assertEqual(bulk_upsert(_frame(*rows)), (1, 0, 0, 0))
+        self.assertEqual(Opportunity.objects.get().title, "Latest, last row")
+
+    def test_older_postings_of_another_file_of_the_day_are_superseded(self) -> None:
+        row = _row(post_date="2025-01-20")
+        bulk_upsert(_frame(row, source="2025-02.csv"))
+        older = _row(**{**row, "post_date": "2025-01-10", "opportunity_title": "Old"})
+
+        self.assertEqual(bulk_upsert(_frame(older, source="2025-01.csv")), (0, 0, 0, 1))
+        self.assertEqual(Opportunity.objects.get().title, row["opportunity_title"])
+
+    def test_grants_moved_back_upstream_are_still_updated(self) -> None:
+        row = _row(post_date="2025-01-20")
+        bulk_upsert(_frame(row))
+        moved = _row(**{**row, "post_date": "2025-01-10", "opportunity_title": "Moved"})
+
+        # Written again from the same source, or from any source on a later day
+        self.assertEqual(bulk_upsert(_frame(moved)), (0, 1, 0, 0))
+        later = _row(**{**moved, "opportunity_title": "Later"})
+        self.assertEqual(
+            bulk_upsert(_frame(later, source="other.csv", injection_date=datetime.date(2025, 3, 1))), (0, 1, 0, 0)
+        )
+        self.assertEqual(Opportunity.objects.get().title, "Later")
+
+    def test_vectorized_is_reset_only_when_the_content_changes(self) -> None:
+        row = _row()
+        bulk_upsert(_frame(row))
+        Opportunity.objects.update(vectorized=True)
+
+        bulk_upsert(_frame(_row(**{**row, "additional_info_url": "https://example.com"})))
+        self.assertTrue(Opportunity.objects.get().vectorized)
+
+        bulk_upsert(_frame(row, source="renamed.csv"))
+        self.assertTrue(Opportunity.objects.get().vectorized)
+
+        bulk_upsert(_frame(_row(**{**row, "summary_description": fake.paragraph()}), source="renamed.csv"))
+        self.assertFalse(Opportunity.objects.get().vectorized)
+
+    def test_chunk_filter_columns_follow_updates(self) -> None:
+        row = _row()
+        bulk_upsert(_frame(row))
+        OpportunityChunk.objects.create(
+            id=uuid.uuid4(),
+            opportunity_id=row["opportunity_id"],
+            index=0,
+            text="chunk",
+            embedding=[1.0] * settings.EMBEDDING_DIMENSIONS,
+        )
+        version = corpus_version()
+
+        bulk_upsert(_frame(_row(**{**row, "close_date": "2025-05-01", "archive_date": "2025-06-01"})))
+
+        chunk = OpportunityChunk.objects.get()
+        self.assertEqual((chunk.closed, chunk.archived), (datetime.date(2025, 5, 1), datetime.date(2025, 6, 1)))
+        self.assertEqual(corpus_version(), version + 1)
+
+        bulk_upsert(_frame(_row(**{**row, "close_date": "2025-05-01", "archive_date": "2025-06-01"})))
+        self.assertEqual(corpus_version(), version + 1)
+
+    def test_empty_frame(self) -> None:
+        self.assertEqual(bulk_upsert(_frame()), (0, 0, 0, 0))
+
+
+@ddt
+class TestIngest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.rows = [_row() for _ in range(5)]
+        self.path = os.path.join(directory.name, "export.csv")
+        pd.DataFrame(self.rows).to_csv(self.path, index=False)
+
+    def _checkpoint(self, rows: int, fingerprint: str | None = None) -> None:
+        IngestionCheckpoint.objects.create(
+            source=str(Path(self.path).resolve()), rows=rows, fingerprint=fingerprint or file_fingerprint(self.path)
+        )
+
+    @data(False, True)
+    def test_every_row_is_ingested_and_the_checkpoint_removed(self, bulk: bool) -> None:
+        result = ingest(self.path, chunksize=2, bulk=bulk)
+
+        self.assertEqual((result.created, result.updated, result.resumed_from), (5, 0, 0))
+        self.assertEqual(Opportunity.objects.count(), 5)
+        self.assertFalse(IngestionCheckpoint.objects.exists())
+
+    def test_interrupted_ingestion_resumes_after_the_last_committed_chunk(self) -> None:
+        calls = []
+
+        def fail_second_chunk(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return write(**kwargs)
+
+        with patch("opportunity.services.ingestion.write", side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                ingest(self.path, chunksize=2, bulk=True)
+
+        self.assertEqual(IngestionCheckpoint.objects.get().rows, 2)
+        self.assertEqual(Opportunity.objects.count(), 2)
+
+        result = ingest(self.path, chunksize=2, bulk=True)
+
+        self.assertEqual((result.resumed_from, result.created), (2, 3))
+        self.assertEqual(Opportunity.objects.count(), 5)
+        self.assertFalse(IngestionCheckpoint.objects.exists())
+
+    def test_restart_ignores_the_checkpoint(self) -> None:
+        self._checkpoint(rows=4)
+
+        result = ingest(self.path, chunksize=2, restart=True)
+
+        self.assertEqual((result.resumed_from, result.created), (0, 5))
+
+    def test_replaced_file_is_ingested_from_the_start(self) -> None:
+        self._checkpoint(rows=4, fingerprint="0:0")
+
+        result = ingest(self.path, chunksize=2)
+
+        self.assertEqual((result.resumed_from, result.created), (0, 5))
+
+    def test_rejects_are_reported(self) -> None:
+        self.rows[1]["opportunity_id"] = "12345"
+        self.rows[3]["opportunity_title"] = None
+        pd.DataFrame(self.rows).to_csv(self.path, index=False)
+
+        result = ingest(self.path, chunksize=2)
+
+        self.assertEqual((result.created, result.rejected), (3, 2))
+        self.assertEqual(result.rejects_path, f"{self.path}.rejects.csv")
+        with open(result.rejects_path, newline="") as report:
+            rows = list(csv.DictReader(report))
+        self.assertEqual(
+            [(row["row"], row["opportunity_id"]) for row in rows],
+            [("1", "12345"), ("3", self.rows[3]["opportunity_id"])],
+        )
+        self.assertIn("id is not a valid UUID", rows[0]["error"])
+        self.assertIn("title is missing", rows[1]["error"])
+
+    def test_resumed_ingestion_appends_to_the_reject_report(self) -> None:
+        self.rows[0]["opportunity_id"] = "12345"
+        self.rows[3]["opportunity_id"] = "67890"
+        pd.DataFrame(self.rows).to_csv(self.path, index=False)
+        with open(f"{self.path}.rejects.csv", "w", newline="") as report:
+            csv.writer(report).writerows([("row", "opportunity_id", "error"), (0, "12345", "id is not a valid UUID")])
+        self._checkpoint(rows=2)
+
+        result = ingest(self.path, chunksize=2)
+
+        with open(result.rejects_path, newline="") as report:
+            rows = list(csv.DictReader(report))
+        self.assertEqual([row["opportunity_id"] for row in rows], ["12345", "67890"])
+
+    @data(False, True)
+    def test_files_converge_whatever_order_they_are_ingested(self, bulk: bool) -> None:
+        edited, reposted = _row(post_date="2025-01-15"), _row(post_date="2025-01-15")
+        older = os.path.join(os.path.dirname(self.path), "2025-01.csv")
+        newer = os.path.join(os.path.dirname(self.path), "2025-02.csv")
+        pd.DataFrame([edited, {**reposted, "post_date": "2025-03-01"}]).to_csv(older, index=False)
+        pd.DataFrame([{**edited, "opportunity_title": "Edited"}, reposted]).to_csv(newer, index=False)
+
+        for paths in ([older, newer], [newer, older]):
+            with self.subTest(paths=paths):
+                Opportunity.objects.all().delete()
+                results = [ingest(path, chunksize=10, bulk=bulk) for path in paths]
+
+                self.assertEqual(Opportunity.objects.get(id=edited["opportunity_id"]).title, "Edited")
+                self.assertEqual(Opportunity.objects.get(id=reposted["opportunity_id"]).source, older)
+                self.assertEqual((results[-1].updated, results[-1].superseded), (1, 1))
+
+
+class TestInjectCommand(SimpleTestCase):
+    class _Executor(ThreadPoolExecutor):
+        def __init__(self, max_workers: int, mp_context=None, initializer=None) -> None:
+            super().__init__(max_workers=max_workers)
+
+    @patch("opportunity.management.commands.inject.vectorize_grants")
+    @patch("opportunity.management.commands.inject.ingest")
+    def test_failed_files_fail_the_command(self, ingest_, vectorize_grants) -> None:
+        def ingest_file(path: str, **kwargs) -> IngestionResult:
+            if path == "broken.csv":
+                raise ValueError("unreadable")
+            return IngestionResult(path=path, created=2)
+
+        ingest_.side_effect = ingest_file
+
+        with patch("opportunity.management.commands.inject.ProcessPoolExecutor", self._Executor):
+            with self.assertRaisesMessage(CommandError, "Failed to inject 1 of 3 files: broken.csv"):
+                call_command("inject", "a.csv", "broken.csv", "b.csv", workers=2, stdout=io.StringIO())
+
+        self.assertEqual(ingest_.call_count, 3)
+        self.assertTrue(all(call.kwargs["bulk"] for call in ingest_.call_args_list))
+        vectorize_grants.delay.assert_called_once()
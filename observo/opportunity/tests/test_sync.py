@@ -0,0 +1,233 @@
+import datetime
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+import faker
+import pandas as pd
+from ddt import data, ddt
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from opportunity.models import Opportunity, SyncCursor
+from opportunity.services.ingestion import normalize, to_records
+from opportunity.services.sync import GrantsClient, _next_cursor, sync, to_frame
+
+fake = faker.Faker()
+
+
+def _record(updated_at: str = "2025-05-01T10:00:00Z") -> dict:
+    return {
+        "opportunity_id": fake.uuid4(),
+        "opportunity_number": fake.bothify("??-###"),
+        "opportunity_title": fake.sentence(),
+        "agency_code": "NSF",
+        "agency_name": "National Science Foundation",
+        "top_level_agency_name": "National Science Foundation",
+        "updated_at": updated_at,
+        "summary": {
+            "post_date": "2025-04-01",
+            "close_date": None,
+            "close_date_description": None,
+            "archive_date": None,
+            "expected_number_of_awards": 3,
+            "award_ceiling": 500000,
+            "additional_info_url": "",
+            "applicant_eligibility_description": None,
+            "summary_description": fake.paragraph(),
+            "funding_categories": ["education", "science_technology_and_other_research_and_development"],
+        },
+    }
+
+
+class _GrantsAPI(BaseHTTPRequestHandler):
+    records: list[dict] = []
+    requests: list[dict] = []
+
+    def do_GET(self):  # noqa: N802
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        self.requests.append(params)
+
+        page, size = int(params["page"]), int(params["page_size"])
+        body = {
+            "data": self.records[(page - 1) * size : page * size],
+            "pagination_info": {"total_pages": max(-(-len(self.records) // size), 1)},
+        }
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ServerMixin:
+    def setUp(self):
+        _GrantsAPI.records = [_record() for _ in range(7)]
+        _GrantsAPI.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _GrantsAPI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/opportunities"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@ddt
+class TestGrantsClient(_ServerMixin, SimpleTestCase):
+    @data(1, 3, 10)
+    def test_pages_fetches_every_record(self, page_size: int) -> None:
+        client = GrantsClient(url=self.url, page_size=page_size)
+
+        pages = dict(client.pages(workers=3))
+
+        expected = max(-(-7 // page_size), 1)
+        self.assertEqual(sorted(pages), list(range(1, expected + 1)))
+        ids = [record["opportunity_id"] for number in sorted(pages) for record in pages[number]["data"]]
+        self.assertEqual(ids, [record["opportunity_id"] for record in _GrantsAPI.records])
+
+    def test_since_is_sent_as_modified_since(self) -> None:
+        since = datetime.datetime(2025, 5, 1, tzinfo=datetime.UTC)
+
+        list(GrantsClient(url=self.url, page_size=5).pages(since=since))
+
+        self.assertEqual({params["modified_since"] for params in _GrantsAPI.requests}, {since.isoformat()})
+
+
+class TestToFrame(SimpleTestCase):
+    def test_records_are_normalized_like_exports(self) -> None:
+        record = _record()
+
+        frame = to_frame([record], offset=200)
+        valid, rejects = normalize(frame=frame, source="api", injection_date=datetime.date(2025, 5, 2))
+
+        self.assertTrue(rejects.empty)
+        self.assertEqual(list(valid.index), [200])
+        [values] = to_records(valid)
+        self.assertEqual(values["id"], record["opportunity_id"])
+        self.assertEqual(values["categories"], record["summary"]["funding_categories"])
+        self.assertEqual(values["opened"], datetime.date(2025, 4, 1))
+        self.assertEqual(values["funding"], 500000)
+        self.assertIsNone(values["link"])
+        self.assertIsNone(values["closed"])
+
+    def test_next_cursor(self) -> None:
+        def stamps(*values: str | None) -> pd.Series:
+            return pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+
+        accepted = stamps("2025-05-01T10:00:00Z", "2025-05-03T08:30:00Z", "2025-05-02T00:00:00Z", None)
+
+        self.assertEqual(
+            _next_cursor(accepted, rejected=stamps()), datetime.datetime(2025, 5, 3, 8, 30, tzinfo=datetime.UTC)
+        )
+        self.assertEqual(
+            _next_cursor(accepted, rejected=stamps("2025-05-02T12:00:00Z", None)),
+            datetime.datetime(2025, 5, 2, tzinfo=datetime.UTC),
+        )
+        self.assertIsNone(_next_cursor(accepted, rejected=stamps("2025-04-01T00:00:00Z")))
+        self.assertIsNone(_next_cursor(stamps(None), rejected=stamps()))
+
+
+class TestSync(_ServerMixin, TestCase):
+    def test_grants_are_upserted_and_the_cursor_stored(self) -> None:
+        _GrantsAPI.records[3]["updated_at"] = "2025-05-04T09:00:00Z"
+
+        result = sync(GrantsClient(url=self.url, page_size=3), workers=2)
+
+        self.assertEqual((result.pages, result.created, result.updated, result.rejected), (3, 7, 0, 0))
+        self.assertIsNone(result.since)
+        self.assertEqual(Opportunity.objects.count(), 7)
+        stored = SyncCursor.objects.get(source=self.url).cursor
+        self.assertEqual(stored, result.cursor)
+        self.assertEqual(stored, datetime.datetime(2025, 5, 4, 9, tzinfo=datetime.UTC))
+
+        _GrantsAPI.requests.clear()
+        again = sync(GrantsClient(url=self.url, page_size=3))
+
+        self.assertEqual((again.since, again.created, again.unchanged), (stored, 0, 7))
+        self.assertEqual({params["modified_since"] for params in _GrantsAPI.requests}, {stored.isoformat()})
+
+    def test_rejected_grants_hold_the_cursor_back(self) -> None:
+        _GrantsAPI.records[2]["opportunity_id"] = "12345"
+        _GrantsAPI.records[2]["updated_at"] = "2025-05-02T00:00:00Z"
+        _GrantsAPI.records[5]["updated_at"] = "2025-05-03T00:00:00Z"
+
+        result = sync(GrantsClient(url=self.url, page_size=3))
+
+        self.assertEqual((result.created, result.rejected), (6, 1))
+        self.assertEqual(result.cursor, datetime.datetime(2025, 5, 1, 10, tzinfo=datetime.UTC))
+
+        # Once fixed upstream, the Grant is picked up and the cursor moves on
+        _GrantsAPI.records[2]["opportunity_id"] = fake.uuid4()
+        result = sync(GrantsClient(url=self.url, page_size=3))
+
+        self.assertEqual((result.created, result.rejected), (1, 0))
+        self.assertEqual(result.cursor, datetime.datetime(2025, 5, 3, tzinfo=datetime.UTC))
+
+    def test_grants_the_database_refuses_hold_the_cursor_back(self) -> None:
+        # A different Grant reusing a stored opportunity number breaks its unique constraint
+        existing = Opportunity.objects.create(
+            identifier=_GrantsAPI.records[4]["opportunity_number"],
+            title="Existing",
+            code="NSF",
+            agency="National Science Foundation",
+            head="National Science Foundation",
+            opened=datetime.date(2025, 1, 1),
+        )
+        _GrantsAPI.records[4]["updated_at"] = "2025-05-02T00:00:00Z"
+        _GrantsAPI.records[6]["updated_at"] = "2025-05-03T00:00:00Z"
+
+        result = sync(GrantsClient(url=self.url, page_size=3))
+
+        self.assertEqual((result.pages, result.created, result.rejected), (3, 6, 1))
+        self.assertEqual(Opportunity.objects.count(), 7)
+        self.assertEqual(result.cursor, datetime.datetime(2025, 5, 1, 10, tzinfo=datetime.UTC))
+
+        existing.delete()
+        result = sync(GrantsClient(url=self.url, page_size=3))
+
+        self.assertEqual((result.created, result.rejected), (1, 0))
+        self.assertEqual(result.cursor, datetime.datetime(2025, 5, 3, tzinfo=datetime.UTC))
+
+    def test_full_sync_ignores_the_cursor(self) -> None:
+        cursor = datetime.datetime(2025, 6, 1, tzinfo=datetime.UTC)
+        SyncCursor.objects.create(source=self.url, cursor=cursor)
+
+        result = sync(GrantsClient(url=self.url, page_size=5), full=True)
+
+        self.assertIsNone(result.since)
+        self.assertEqual(result.created, 7)
+        self.assertNotIn("modified_since", _GrantsAPI.requests[0])
+        self.assertEqual(SyncCursor.objects.get(source=self.url).cursor, cursor)
+
+
+@patch("opportunity.management.commands.sync.vectorize_grants")
+class TestSyncCommand(_ServerMixin, TestCase):
+    def test_sync_queues_vectorization(self, vectorize_grants) -> None:
+        out = io.StringIO()
+
+        call_command("sync", url=self.url, page_size=5, stdout=out)
+
+        self.assertIn("Synced 2 pages of Grants modified since the beginning.", out.getvalue())
+        self.assertIn("created 7 Grants", out.getvalue())
+        vectorize_grants.delay.assert_called_once()
+
+        call_command("sync", url=self.url, page_size=5, stdout=io.StringIO())
+        vectorize_grants.delay.assert_called_once()
+
+    def test_no_vectorize(self, vectorize_grants) -> None:
+        call_command("sync", url=self.url, no_vectorize=True, stdout=io.StringIO())
+
+        vectorize_grants.delay.assert_not_called()
+
+    @override_settings(GRANTS_API_URL=None)
+    def test_url_is_required(self, vectorize_grants) -> None:
+        with self.assertRaisesMessage(CommandError, "Set GRANTS_API_URL or pass --url."):
+            call_command("sync", url=None, stdout=io.StringIO())
@@ -0,0 +1,121 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from opportunity.models import OpportunityChunk, VectorizationRun
+from opportunity.services.vectorization import pending_opportunities
+from opportunity.tasks import finish_vectorization, vectorize_grants, vectorize_shard
+from opportunity.tests.test_vectorization import _embed, _opportunity
+
+MODULE = "opportunity.tasks.vectorize"
+
+
+def _cache(embed=None) -> MagicMock:
+    cache = MagicMock()
+    cache.embed_documents.side_effect = embed or (lambda texts, embed=None: [_embed(text) for text in texts])
+    return cache
+
+
+class TestVectorizeGrants(TestCase):
+    def setUp(self):
+        self.opportunities = [_opportunity() for _ in range(5)]
+
+    @patch(f"{MODULE}.chord")
+    def test_pending_grants_are_sharded(self, chord) -> None:
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pk = vectorize_grants(shard_size=2)
+            chord.assert_not_called()
+
+        run = VectorizationRun.objects.get(pk=run_pk)
+        self.assertEqual((run.total, run.shards), (5, 3))
+        self.assertTrue(run.running)
+        [header], _ = chord.call_args
+        self.assertEqual(sorted(len(task.args[1]) for task in header), [1, 2, 2])
+        chord.return_value.assert_called_once_with(finish_vectorization.s(run_pk, 2))
+
+    @patch(f"{MODULE}.chord")
+    def test_single_run_at_a_time(self, chord) -> None:
+        VectorizationRun.objects.create(total=1, shards=1)
+
+        self.assertIsNone(vectorize_grants())
+        chord.assert_not_called()
+
+
+class TestVectorizeShard(TestCase):
+    def setUp(self):
+        self.opportunities = [_opportunity() for _ in range(2)]
+        self.ids = [str(opportunity.id) for opportunity in self.opportunities]
+        self.run = VectorizationRun.objects.create(total=2, shards=1)
+
+    def test_progress_is_recorded(self) -> None:
+        with patch(f"{MODULE}.embeddings", return_value=_cache()):
+            vectorize_shard(self.run.pk, self.ids)
+        finish_vectorization([None], self.run.pk)
+
+        self.run.refresh_from_db()
+        self.assertEqual((self.run.done, self.run.failed, self.run.progress), (2, 0, 100))
+        self.assertEqual(self.run.chunks, OpportunityChunk.objects.count())
+        self.assertFalse(self.run.running)
+
+    def test_failures_are_recorded_and_left_for_the_next_run(self) -> None:
+        def fail(texts, embed=None):
+            raise RuntimeError("quota exceeded")
+
+        with patch(f"{MODULE}.embeddings", return_value=_cache(fail)):
+            vectorize_shard(self.run.pk, self.ids)
+
+        self.run.refresh_from_db()
+        self.assertEqual((self.run.done, self.run.failed, self.run.error), (0, 2, "quota exceeded"))
+        self.assertFalse(any(opportunity.vectorized for opportunity in self.opportunities))
+
+
+class TestFinishVectorization(TestCase):
+    def setUp(self):
+        self.stale = _opportunity()
+        self.run = VectorizationRun.objects.create(total=1, shards=1, failed=1)
+
+    @patch(f"{MODULE}.vectorize_grants")
+    def test_grants_changed_during_the_run_get_another_run(self, vectorize_grants) -> None:
+        _opportunity()
+
+        finish_vectorization([None], self.run.pk, shard_size=50)
+
+        self.run.refresh_from_db()
+        self.assertFalse(self.run.running)
+        vectorize_grants.delay.assert_called_once_with(shard_size=50)
+
+    @patch(f"{MODULE}.vectorize_grants")
+    def test_failed_grants_wait_for_the_next_trigger(self, vectorize_grants) -> None:
+        finish_vectorization([None], self.run.pk)
+
+        vectorize_grants.delay.assert_not_called()
+
+
+class TestConcurrentTriggers(TransactionTestCase):
+    def test_a_single_run_is_planned(self) -> None:
+        _opportunity()
+        results = []
+
+        def slow_pending():
+            # Widens the window between checking for a running run and creating one
+            time.sleep(0.2)
+            return pending_opportunities()
+
+        def trigger():
+            try:
+                results.append(vectorize_grants())
+            finally:
+                connection.close()
+
+        with patch(f"{MODULE}.chord"), patch(f"{MODULE}.pending_opportunities", side_effect=slow_pending):
+            threads = [threading.Thread(target=trigger) for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(VectorizationRun.objects.count(), 1)
+        self.assertEqual(sorted(results, key=lambda pk: pk is not None), [None, VectorizationRun.objects.get().pk])
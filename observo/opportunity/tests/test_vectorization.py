@@ -0,0 +1,540 @@
+import datetime
+import hashlib
+import io
+import math
+from unittest.mock import MagicMock, patch
+
+import faker
+import numpy as np
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from opportunity.management.commands.vector_index import Command as VectorIndexCommand
+from opportunity.models import VECTOR_INDEX, Opportunity, OpportunityChunk
+from opportunity.services.corpus import DEFAULT_CHUNKS_PER_DOC, chunks_per_doc, corpus_version, refresh_corpus_stats
+from opportunity.services.retrieval import (
+    adaptive_opportunities,
+    diverse_opportunities,
+    hybrid_opportunities,
+    lexical_opportunity_ids,
+    nearest_chunk_ids,
+    nearest_opportunities,
+    reciprocal_rank_fusion,
+)
+from opportunity.services.vectorization import mark_title_duplicates, pending_opportunities, vectorize_opportunities
+from utils.vector_db import MAX_EF_SEARCH, chunk_id, search_params, supports_iterative_scan
+
+fake = faker.Faker()
+
+
+def _embed(text: str) -> list[float]:
+    # Deterministic pseudo-random vector per text
+    seed = int(hashlib.sha256(text.encode()).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).normal(size=settings.EMBEDDING_DIMENSIONS).tolist()
+
+
+def _opportunity(**overrides) -> Opportunity:
+    values = {
+        "identifier": fake.unique.bothify("??-####"),
+        "title": fake.sentence(),
+        "code": "NSF",
+        "agency": "National Science Foundation",
+        "head": "National Science Foundation",
+        "opened": datetime.date(2025, 1, 1),
+        "summary": fake.paragraph(nb_sentences=20),
+        "funding": 100_000,
+    }
+    values.update(overrides)
+    return Opportunity.objects.create(**values)
+
+
+class TestVectorizeOpportunities(TestCase):
+    def setUp(self):
+        self.splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        self.embedded: list[str] = []
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [_embed(text) for text in texts]
+
+    def test_chunks_are_stored_with_filter_columns(self) -> None:
+        opportunity = _opportunity(closed=datetime.date(2025, 6, 1), categories=["education"])
+
+        inserted, deleted = vectorize_opportunities([opportunity], splitter=self.splitter, embed=self._embed)
+
+        chunks = list(opportunity.chunks.order_by("index"))
+        self.assertEqual(inserted, len(chunks))
+        self.assertEqual(deleted, 0)
+        self.assertEqual([chunk.text for chunk in chunks], self.splitter.split_text(opportunity.describe()))
+        self.assertTrue(all(chunk.funding == 100_000 and chunk.categories == ["education"] for chunk in chunks))
+        opportunity.refresh_from_db()
+        self.assertTrue(opportunity.vectorized)
+
+    def test_unchanged_chunks_are_kept_and_stale_ones_replaced(self) -> None:
+        opportunity = _opportunity()
+        vectorize_opportunities([opportunity], splitter=self.splitter, embed=self._embed)
+        before = set(opportunity.chunks.values_list("id", flat=True))
+
+        self.embedded.clear()
+        opportunity.summary = opportunity.summary + " " + fake.sentence()
+        opportunity.save()
+        inserted, deleted = vectorize_opportunities([opportunity], splitter=self.splitter, embed=self._embed)
+
+        after = set(opportunity.chunks.values_list("id", flat=True))
+        self.assertEqual(len(self.embedded), inserted)
+        self.assertEqual(len(after - before), inserted)
+        self.assertEqual(len(before - after), deleted)
+        self.assertLess(inserted, len(after))
+
+    def test_filter_columns_follow_the_opportunity(self) -> None:
+        opportunity = _opportunity()
+        vectorize_opportunities([opportunity], splitter=self.splitter, embed=self._embed)
+
+        opportunity.closed = datetime.date(2025, 9, 30)
+        opportunity.save()
+
+        self.assertEqual(set(opportunity.chunks.values_list("closed", flat=True)), {datetime.date(2025, 9, 30)})
+
+        opportunity.archived = datetime.date(2025, 10, 30)
+        opportunity.save()
+
+        self.assertEqual(set(opportunity.chunks.values_list("archived", flat=True)), {datetime.date(2025, 10, 30)})
+
+
+class TestPendingOpportunities(TestCase):
+    def test_open_and_latest_grant_represents_its_title(self) -> None:
+        # Archives and the current snapshot ingested together post the same Grant several times
+        closed = _opportunity(title="Same title", closed=datetime.date(2024, 6, 1), opened=datetime.date(2024, 1, 1))
+        older = _opportunity(title="Same title", opened=datetime.date(2024, 1, 1))
+        latest = _opportunity(title="Same title", opened=datetime.date(2025, 1, 1))
+        other = _opportunity(title="Other title", archived=datetime.date(2024, 6, 1))
+
+        pending = list(pending_opportunities())
+        mark_title_duplicates(pending)
+
+        self.assertEqual(pending, [other, latest])
+        self.assertEqual(Opportunity.objects.filter(id__in=[closed.id, older.id], vectorized=True).count(), 2)
+
+
+@patch("opportunity.management.commands.vectorize.embeddings")
+class TestVectorizeCommand(TestCase):
+    def setUp(self):
+        self.opportunities = [_opportunity() for _ in range(5)]
+
+    @staticmethod
+    def _cache(embed=None) -> MagicMock:
+        cache = MagicMock()
+        cache.embed_documents.side_effect = embed or (lambda texts, embed=None: [_embed(text) for text in texts])
+        return cache
+
+    def test_grants_are_vectorized_page_by_page(self, embeddings) -> None:
+        embeddings.return_value = self._cache()
+        out = io.StringIO()
+
+        call_command("vectorize", page_size=2, chunk_size=300, chunk_overlap=0, stdout=out)
+
+        self.assertEqual(embeddings.return_value.embed_documents.call_count, 3)
+        self.assertFalse(Opportunity.objects.exclude(vectorized=True).exists())
+        self.assertEqual(
+            set(OpportunityChunk.objects.values_list("opportunity", flat=True)), {o.id for o in self.opportunities}
+        )
+        self.assertIn(f"Successfully injected 5 Grants (#chunks = {OpportunityChunk.objects.count()})", out.getvalue())
+
+        call_command("vectorize", stdout=out)
+        self.assertIn("No chunks were found!", out.getvalue())
+
+    def test_failures_stop_after_the_committed_pages(self, embeddings) -> None:
+        pages = []
+
+        def embed(texts, embed=None):
+            pages.append(texts)
+            if len(pages) == 2:
+                raise RuntimeError("quota exceeded")
+            return [_embed(text) for text in texts]
+
+        embeddings.return_value = self._cache(embed)
+
+        with self.assertRaisesMessage(CommandError, "Stopped after 2 Grants"):
+            call_command("vectorize", page_size=2, stdout=io.StringIO())
+
+        self.assertEqual(Opportunity.objects.filter(vectorized=True).count(), 2)
+
+    @patch("opportunity.management.commands.vectorize.vectorize_grants")
+    def test_background_queues_sharded_tasks(self, vectorize_grants, embeddings) -> None:
+        call_command("vectorize", background=True, shard_size=50, stdout=io.StringIO())
+
+        vectorize_grants.delay.assert_called_once_with(shard_size=50)
+        embeddings.assert_not_called()
+        self.assertFalse(Opportunity.objects.filter(vectorized=True).exists())
+
+
+class TestNearestOpportunities(TestCase):
+    def setUp(self):
+        splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        self.funded = [_opportunity() for _ in range(3)]
+        self.unfunded = _opportunity(funding=None)
+        vectorize_opportunities(
+            [*self.funded, self.unfunded],
+            splitter=splitter,
+            embed=lambda texts: [_embed(text) for text in texts],
+        )
+
+    def test_exact_chunk_ranks_its_opportunity_first(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.funded[1]).first()
+
+        [nearest] = nearest_opportunities(_embed(chunk.text), k=10, limit=1, funding=True)
+
+        self.assertEqual(nearest, self.funded[1])
+        self.assertAlmostEqual(nearest.distance, 0.0)
+
+    def test_results_are_distinct_and_filtered(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.unfunded).first()
+
+        funded = nearest_opportunities(_embed(chunk.text), k=100, limit=10, funding=True)
+        unfunded = nearest_opportunities(_embed(chunk.text), k=100, limit=10, funding=False)
+
+        self.assertCountEqual(funded, self.funded)
+        self.assertEqual(unfunded, [self.unfunded])
+
+    def test_closed_and_archived_opportunities_are_excluded(self) -> None:
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        closed, archived, open_ = self.funded
+        OpportunityChunk.objects.filter(opportunity=closed).update(closed=yesterday)
+        OpportunityChunk.objects.filter(opportunity=archived).update(archived=datetime.date.today())
+        OpportunityChunk.objects.filter(opportunity=open_).update(closed=datetime.date.today())
+        chunk = OpportunityChunk.objects.filter(opportunity=closed).first()
+
+        matched = nearest_opportunities(_embed(chunk.text), k=100, limit=10, funding=True, open_only=True)
+        diverse = diverse_opportunities(_embed(chunk.text), k=100, limit=10, funding=True, open_only=True)
+
+        self.assertEqual(matched, [open_])
+        self.assertEqual(diverse, [open_])
+        self.assertEqual(len(nearest_opportunities(_embed(chunk.text), k=100, limit=10, funding=True)), 3)
+
+    def test_adaptive_search_expands_until_enough_opportunities(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.funded[0]).first()
+
+        # A single chunk holds a single opportunity, so reaching three takes expanding
+        matched = adaptive_opportunities(_embed(chunk.text), limit=3, k=1, max_k=1000, funding=True)
+
+        self.assertEqual(matched[0], self.funded[0])
+        self.assertCountEqual(matched, self.funded)
+        self.assertEqual(matched, nearest_opportunities(_embed(chunk.text), k=1000, limit=3, funding=True))
+
+    def test_adaptive_search_stops_at_the_cap(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.funded[0]).first()
+
+        matched = adaptive_opportunities(_embed(chunk.text), limit=3, k=1, max_k=1, funding=True)
+
+        self.assertEqual(matched, [self.funded[0]])
+
+    def test_adaptive_search_at_reduced_precision_caps_the_scan(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.funded[0]).first()
+
+        # Four candidates per chunk would ask for an ef_search of 8000 at the last expansion
+        with (
+            override_settings(VECTOR_PRECISION="half", VECTOR_RERANK_FACTOR=4),
+            patch("opportunity.services.retrieval.search_params", wraps=search_params) as params,
+        ):
+            matched = adaptive_opportunities(_embed(chunk.text), limit=10, k=1, max_k=2000, funding=True)
+
+        self.assertEqual(matched[0], self.funded[0])
+        self.assertCountEqual(matched, self.funded)
+        self.assertEqual(max(call.kwargs["ef_search"] for call in params.call_args_list), MAX_EF_SEARCH)
+
+    def test_reduced_precision_is_rescored_at_full_precision(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.funded[2]).first()
+        exact = nearest_chunk_ids(_embed(chunk.text), k=5, precision="full")
+
+        for precision in ("half", "binary"):
+            with self.subTest(precision=precision), override_settings(VECTOR_PRECISION=precision):
+                [nearest] = nearest_opportunities(_embed(chunk.text), k=10, limit=1)
+                self.assertEqual(nearest, self.funded[2])
+                self.assertAlmostEqual(nearest.distance, 0.0)
+                self.assertEqual(nearest_chunk_ids(_embed(chunk.text), k=5)[0], exact[0])
+
+    def test_scan_parameters_can_be_set_per_query(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.funded[0]).first()
+
+        with patch("opportunity.services.retrieval.search_params", wraps=search_params) as params:
+            [nearest] = nearest_opportunities(_embed(chunk.text), k=10, limit=1, ef_search=400, probes=3)
+            nearest_opportunities(_embed(chunk.text), k=500, limit=1, ef_search=40)
+            nearest_opportunities(_embed(chunk.text), k=10, limit=1)
+
+        self.assertEqual(nearest, self.funded[0])
+        self.assertEqual(
+            [call.kwargs for call in params.call_args_list],
+            [
+                {"ef_search": 400, "probes": 3, "iterative_scan": settings.VECTOR_ITERATIVE_SCAN},
+                {"ef_search": 500, "probes": settings.VECTOR_PROBES, "iterative_scan": settings.VECTOR_ITERATIVE_SCAN},
+                {
+                    "ef_search": settings.VECTOR_EF_SEARCH,
+                    "probes": settings.VECTOR_PROBES,
+                    "iterative_scan": settings.VECTOR_ITERATIVE_SCAN,
+                },
+            ],
+        )
+
+    def test_diverse_opportunities_are_distinct_with_their_distance(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.funded[0]).first()
+
+        opportunities = diverse_opportunities(_embed(chunk.text), k=100, limit=3, funding=True)
+
+        self.assertEqual(opportunities[0], self.funded[0])
+        self.assertAlmostEqual(opportunities[0].distance, 0.0)
+        self.assertCountEqual(opportunities, self.funded)
+        self.assertTrue(all(opportunity.distance >= 0 for opportunity in opportunities))
+
+
+class TestFilteredScan(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.query = np.array(_embed("query"))
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+
+        # The nearest chunks by far belong to closed Grants, which the index scan has to skip
+        self.closed = [_opportunity(closed=yesterday) for _ in range(200)]
+        self.open = [_opportunity() for _ in range(5)]
+        scales = {**dict.fromkeys(self.closed, 0.05), **dict.fromkeys(self.open, 1.0)}
+        OpportunityChunk.objects.bulk_create(
+            OpportunityChunk(
+                id=chunk_id(str(opportunity.id), 0, opportunity.title),
+                opportunity=opportunity,
+                index=0,
+                text=opportunity.title,
+                embedding=(self.query + rng.normal(scale=scale, size=self.query.size)).tolist(),
+                **{field: getattr(opportunity, field) for field in OpportunityChunk.FILTER_FIELDS},
+            )
+            for opportunity, scale in scales.items()
+        )
+
+    def test_open_grants_are_found_past_the_closed_ones(self) -> None:
+        if not supports_iterative_scan():
+            self.skipTest("pgvector 0.8 or later is required")
+
+        with connection.cursor() as cursor:
+            # Small as it is, the table must be searched through the index
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+        for retrieval in (nearest_opportunities, adaptive_opportunities):
+            with self.subTest(retrieval=retrieval.__name__):
+                kwargs = {"max_k": 10} if retrieval is adaptive_opportunities else {}
+                opportunities = retrieval(self.query, k=10, limit=3, open_only=True, ef_search=40, **kwargs)
+                self.assertEqual(len(opportunities), 3)
+                self.assertTrue(set(opportunities) <= set(self.open))
+                distances = [opportunity.distance for opportunity in opportunities]
+                self.assertEqual(distances, sorted(distances))
+
+
+@patch.object(VectorIndexCommand, "_report")
+@patch.object(VectorIndexCommand, "_definition", return_value=None)
+@patch.object(VectorIndexCommand, "_execute")
+class TestVectorIndexCommand(SimpleTestCase):
+    table = OpportunityChunk._meta.db_table
+
+    def _statements(self, execute: MagicMock) -> list[str]:
+        return [call.args[0] for call in execute.call_args_list]
+
+    def test_create_hnsw(self, execute, definition, report) -> None:
+        call_command("vector_index", "create", m=32, ef_construction=128, stdout=io.StringIO())
+
+        self.assertEqual(
+            self._statements(execute),
+            [
+                f"CREATE INDEX CONCURRENTLY {VECTOR_INDEX} ON {self.table} "
+                f"USING hnsw ((embedding) vector_cosine_ops) WITH (m = 32, ef_construction = 128)"
+            ],
+        )
+        report.assert_called_once()
+
+    def test_create_ivfflat(self, execute, definition, report) -> None:
+        call_command("vector_index", "create", method="ivfflat", lists=40, stdout=io.StringIO())
+
+        self.assertEqual(
+            self._statements(execute),
+            [
+                f"CREATE INDEX CONCURRENTLY {VECTOR_INDEX} ON {self.table} "
+                f"USING ivfflat ((embedding) vector_cosine_ops) WITH (lists = 40)"
+            ],
+        )
+
+    @patch.object(VectorIndexCommand, "_default_lists", return_value=7)
+    def test_ivfflat_lists_default_to_the_table_size(self, default_lists, execute, definition, report) -> None:
+        call_command("vector_index", "create", method="ivfflat", stdout=io.StringIO())
+
+        self.assertTrue(self._statements(execute)[0].endswith("WITH (lists = 7)"))
+
+    def test_precisions(self, execute, definition, report) -> None:
+        dimensions = settings.EMBEDDING_DIMENSIONS
+        indexed = {
+            "full": "(embedding) vector_cosine_ops",
+            "half": f"((embedding)::halfvec({dimensions})) halfvec_cosine_ops",
+            "binary": f"(binary_quantize(embedding)::bit({dimensions})) bit_hamming_ops",
+        }
+        for precision, expression in indexed.items():
+            for method, parameters in (("hnsw", "m = 16, ef_construction = 64"), ("ivfflat", "lists = 10")):
+                with self.subTest(precision=precision, method=method):
+                    execute.reset_mock()
+                    call_command(
+                        "vector_index", "create", method=method, lists=10, precision=precision, stdout=io.StringIO()
+                    )
+                    self.assertEqual(
+                        self._statements(execute),
+                        [
+                            f"CREATE INDEX CONCURRENTLY {VECTOR_INDEX} ON {self.table} "
+                            f"USING {method} ({expression}) WITH ({parameters})"
+                        ],
+                    )
+
+    @override_settings(VECTOR_PRECISION="binary")
+    def test_precision_defaults_to_the_setting(self, execute, definition, report) -> None:
+        call_command("vector_index", "create", stdout=io.StringIO())
+
+        self.assertIn("bit_hamming_ops", self._statements(execute)[0])
+
+    def test_rebuild_drops_first_and_sets_the_build_memory(self, execute, definition, report) -> None:
+        definition.return_value = f"CREATE INDEX {VECTOR_INDEX} ..."
+
+        call_command("vector_index", "rebuild", maintenance_work_mem="2GB", stdout=io.StringIO())
+
+        statements = self._statements(execute)
+        self.assertEqual(
+            statements[:2], [f"DROP INDEX CONCURRENTLY IF EXISTS {VECTOR_INDEX}", "SET maintenance_work_mem = %s"]
+        )
+        self.assertEqual(execute.call_args_list[1].args[1], ["2GB"])
+        self.assertTrue(statements[2].startswith(f"CREATE INDEX CONCURRENTLY {VECTOR_INDEX}"))
+
+    def test_drop(self, execute, definition, report) -> None:
+        call_command("vector_index", "drop", stdout=io.StringIO())
+
+        self.assertEqual(self._statements(execute), [f"DROP INDEX CONCURRENTLY IF EXISTS {VECTOR_INDEX}"])
+        report.assert_not_called()
+
+    def test_create_refuses_to_replace_an_index(self, execute, definition, report) -> None:
+        definition.return_value = f"CREATE INDEX {VECTOR_INDEX} ..."
+
+        with self.assertRaisesMessage(CommandError, "use `rebuild` to replace it"):
+            call_command("vector_index", "create", stdout=io.StringIO())
+        execute.assert_not_called()
+
+    def test_invalid_arguments(self, execute, definition, report) -> None:
+        for args in (
+            ["vacuum"],
+            ["create", "--method", "diskann"],
+            ["create", "--m", "many"],
+            ["create", "--precision", "int8"],
+        ):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                call_command("vector_index", *args, stdout=io.StringIO())
+        execute.assert_not_called()
+
+
+class TestVectorIndexDatabase(TestCase):
+    def test_report_describes_the_index(self) -> None:
+        out = io.StringIO()
+
+        call_command("vector_index", "report", stdout=out)
+
+        self.assertIn(f"{OpportunityChunk._meta.db_table}: 0 chunks", out.getvalue())
+        self.assertIn(f"CREATE INDEX {VECTOR_INDEX}", out.getvalue())
+        self.assertIn("valid", out.getvalue())
+
+    def test_recall(self) -> None:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        opportunities = [_opportunity() for _ in range(3)]
+        vectorize_opportunities(opportunities, splitter=splitter, embed=lambda texts: [_embed(t) for t in texts])
+        out = io.StringIO()
+
+        call_command("vector_index", "recall", samples=3, k=5, precision="full", ef_search=200, stdout=out)
+
+        self.assertIn("Recall@5 at full precision: 1.000 over 3 queries", out.getvalue())
+
+    def test_recall_needs_chunks(self) -> None:
+        with self.assertRaisesMessage(CommandError, "vectorize some Grants first"):
+            call_command("vector_index", "recall", stdout=io.StringIO())
+
+
+class TestCorpusStats(TestCase):
+    def test_missing_stats_fall_back_to_the_default(self) -> None:
+        self.assertEqual(chunks_per_doc(), DEFAULT_CHUNKS_PER_DOC)
+
+    def test_refresh_counts_chunks_and_vectorized_grants(self) -> None:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        opportunities = [_opportunity() for _ in range(2)]
+        _opportunity()
+        vectorize_opportunities(opportunities, splitter=splitter, embed=lambda texts: [_embed(t) for t in texts])
+
+        stats = refresh_corpus_stats()
+
+        self.assertEqual((stats.documents, stats.vectorized), (2, 2))
+        self.assertEqual(stats.chunks, OpportunityChunk.objects.count())
+        with self.assertNumQueries(1):
+            self.assertEqual(chunks_per_doc(), math.ceil(stats.chunks / 2))
+
+    def test_version_is_bumped_when_chunks_change(self) -> None:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        opportunity = _opportunity()
+        embed = lambda texts: [_embed(text) for text in texts]  # noqa: E731
+
+        vectorize_opportunities([opportunity], splitter=splitter, embed=embed)
+        self.assertEqual(corpus_version(), 1)
+
+        vectorize_opportunities([opportunity], splitter=splitter, embed=embed)
+        self.assertEqual(corpus_version(), 1)
+
+        opportunity.summary = fake.paragraph()
+        opportunity.save()
+        vectorize_opportunities([opportunity], splitter=splitter, embed=embed)
+        self.assertEqual(corpus_version(), 2)
+
+
+class TestReciprocalRankFusion(SimpleTestCase):
+    def test_items_ranked_by_both_lists_come_first(self) -> None:
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]])
+
+        self.assertEqual(fused[:2], ["a", "c"])
+        self.assertCountEqual(fused, ["a", "b", "c", "d"])
+
+    def test_empty(self) -> None:
+        self.assertEqual(reciprocal_rank_fusion([[], []]), [])
+
+
+class TestLexicalOpportunities(TestCase):
+    def test_exact_terms_are_matched(self) -> None:
+        wanted = _opportunity(code="HHS-NIH11", title="Pediatric oncology research")
+        _opportunity(title="Rural broadband deployment", summary="Fiber networks for remote communities.")
+
+        ids = lexical_opportunity_ids("A lab studying oncology, looking for HHS-NIH11 grants", limit=5)
+
+        self.assertEqual(ids[0], wanted.id)
+
+    def test_funding_filter(self) -> None:
+        unfunded = _opportunity(title="Pediatric oncology research", funding=None)
+
+        self.assertEqual(lexical_opportunity_ids("oncology", limit=5, funding=True), [])
+        self.assertEqual(lexical_opportunity_ids("oncology", limit=5, funding=False), [unfunded.id])
+
+
+class TestHybridOpportunities(TransactionTestCase):
+    # Both queries run on their own connections, so the data has to be committed
+
+    def setUp(self):
+        splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        self.opportunities = [_opportunity() for _ in range(3)]
+        self.named = _opportunity(title="Quantum sensing CAREER awards")
+        vectorize_opportunities(
+            [*self.opportunities, self.named],
+            splitter=splitter,
+            embed=lambda texts: [_embed(text) for text in texts],
+        )
+
+    def test_lexical_and_vector_hits_are_fused(self) -> None:
+        chunk = OpportunityChunk.objects.filter(opportunity=self.opportunities[0]).first()
+
+        matched = hybrid_opportunities("quantum sensing", _embed(chunk.text), k=20, limit=4, funding=True)
+
+        self.assertEqual(set(matched[:2]), {self.opportunities[0], self.named})
+        self.assertTrue(all(opportunity.distance is not None for opportunity in matched))
@@ -4,6 +4,7 @@ from rest_framework import serializers
 
 from search.models import Match, Notification, Website
 from search.tasks import match_proposals, prepare_outline, scrape_website
+from search.tasks.match import cached_proposals
 
 logger = logging.getLogger(__name__)
 
@@ -42,8 +43,12 @@ class MatchSerializer(serializers.ModelSerializer):
         if not (website := validated_data.get("website")):
             website = Website.objects.create(summary=validated_data["summary"])
 
+        arguments = (validated_data["summary"], validated_data["funding"], validated_data["limit"])
+        if (proposals := cached_proposals(*arguments)) is not None:
+            return Match.objects.create(website=website, proposals=proposals)
+
         match = Match.objects.create(website=website)
-        match_proposals.delay(match.pk, validated_data["summary"], validated_data["funding"], validated_data["limit"])
+        match_proposals.delay(match.pk, *arguments)
 
         return match
 
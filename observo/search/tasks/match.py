@@ -1,48 +1,115 @@
+import datetime
+import hashlib
 import logging
-from functools import lru_cache
-from math import ceil
 
 from celery import shared_task
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from opportunity.models import Opportunity
+from django.conf import settings
+from django.core.cache import caches
+from opportunity.services.corpus import chunks_per_doc, corpus_version
+from opportunity.services.retrieval import adaptive_opportunities, diverse_opportunities, hybrid_opportunities
 
 from search.models import Match
-from utils.vector_db import store
+from utils.vector_db import embeddings
 
 logger = logging.getLogger(__name__)
 
 
 @shared_task(name="match_proposals")
-def match_proposals(pk: int, summary: str, funding: bool = True, unique_grants: int = 3) -> None:
+def match_proposals(
+    pk: int,
+    summary: str,
+    funding: bool = True,
+    unique_grants: int = 3,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> None:
     logger.info(f"Matching started for: {summary.split()[:10]}")
 
-    avg_chunks_per_doc = get_avg_chunks_per_doc()
-    k = min(max(unique_grants * avg_chunks_per_doc * 2, 50), 200)
-    logger.debug(f"MMR retrieval params -> k={k}, k={k}, avg_chunks={avg_chunks_per_doc}")
+    scan = {"ef_search": ef_search, "probes": probes}
+    key = proposals_key(summary=summary, funding=funding, unique_grants=unique_grants, **scan)
+    if (matched := _cache("get", key)) is None:
+        matched = find_proposals(summary=summary, funding=funding, unique_grants=unique_grants, **scan)
+        _cache("set", key, matched, settings.MATCH_CACHE_TIMEOUT)
+    else:
+        logger.info(f"Matching served from cache for Match #{pk}")
 
-    retriever = store().as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": k, "fetch_k": k, "lambda_mult": 0.3, "filter": {"funding": funding}},
-    )
+    Match.objects.filter(pk=pk).update(proposals=matched)
 
-    docs = retriever.invoke(summary)
-    # Also compute scored similarities and keep the best (lowest) distance per opportunity id
-    scored = store().similarity_search_with_score(summary, k=k, filter={"funding": funding})
-    id_to_distance: dict[str, float] = {}
-    for scored_doc, distance in scored:
-        gid = scored_doc.metadata.get("id")
-        if not gid:
-            continue
-        if gid not in id_to_distance or distance < id_to_distance[gid]:
-            id_to_distance[gid] = distance
-    uuids: list[str] = []
-    for doc in docs:
-        grant_id = doc.metadata.get("id")
-        if grant_id and grant_id not in uuids:
-            uuids.append(grant_id)
-        if len(uuids) == unique_grants:
-            break
-    opportunities = [Opportunity.objects.get(pk=uuid) for uuid in uuids]
+
+def cached_proposals(
+    summary: str,
+    funding: bool = True,
+    unique_grants: int = 3,
+    ef_search: int | None = None,
+    probes: int | None = None,
+) -> list[dict] | None:
+    """Proposals already matched for the same request against the current corpus, if any."""
+    key = proposals_key(
+        summary=summary, funding=funding, unique_grants=unique_grants, ef_search=ef_search, probes=probes
+    )
+    return _cache("get", key)
+
+
+def proposals_key(
+    summary: str, funding: bool, unique_grants: int, ef_search: int | None = None, probes: int | None = None
+) -> str:
+    # The corpus version changes with the searchable chunks and the date with the open Grants, so older entries
+    # are never served
+    digest = hashlib.sha256(summary.encode()).hexdigest()
+    scope = f"{corpus_version()}:{datetime.date.today().isoformat()}:{settings.MATCH_RETRIEVAL}"
+    # Scan parameters change the approximate results; 0 stands for the configured defaults
+    scan = f"{ef_search or 0}:{probes or 0}"
+    return f"match-proposals:{scope}:{digest}:{int(funding)}:{unique_grants}:{scan}"
+
+
+def find_proposals(
+    summary: str, funding: bool, unique_grants: int, ef_search: int | None = None, probes: int | None = None
+) -> list[dict]:
+    avg_chunks_per_doc = chunks_per_doc()
+    embedding = embeddings().embed_query(summary)
+
+    if settings.MATCH_RETRIEVAL == "hybrid":
+        # Exact terms are found by the lexical query, so the vector side needs far fewer chunks
+        k = min(max(unique_grants * avg_chunks_per_doc, 20), 50)
+        logger.debug(f"Hybrid retrieval params -> k={k}, avg_chunks={avg_chunks_per_doc}")
+        opportunities = hybrid_opportunities(
+            summary,
+            embedding,
+            k=k,
+            limit=unique_grants,
+            funding=funding,
+            open_only=True,
+            ef_search=ef_search,
+            probes=probes,
+        )
+    elif settings.MATCH_RETRIEVAL == "adaptive":
+        # Start from the chunks a typical Grant has and only search more while Grants are missing
+        k = max(unique_grants * avg_chunks_per_doc, 10)
+        logger.debug(f"Adaptive retrieval params -> k={k}, max_k={settings.MATCH_MAX_K}")
+        opportunities = adaptive_opportunities(
+            embedding,
+            limit=unique_grants,
+            k=k,
+            max_k=settings.MATCH_MAX_K,
+            funding=funding,
+            open_only=True,
+            ef_search=ef_search,
+            probes=probes,
+        )
+    else:
+        k = min(max(unique_grants * avg_chunks_per_doc * 2, 50), 200)
+        logger.debug(f"MMR retrieval params -> k={k}, avg_chunks={avg_chunks_per_doc}")
+        # One embedding and one vector scan: MMR and distances both come from the same fetched chunks
+        opportunities = diverse_opportunities(
+            embedding,
+            k=k,
+            limit=unique_grants,
+            funding=funding,
+            open_only=True,
+            lambda_mult=0.3,
+            ef_search=ef_search,
+            probes=probes,
+        )
 
     matched = []
     for opportunity in opportunities:
@@ -56,27 +123,19 @@ def match_proposals(pk: int, summary: str, funding: bool = True, unique_grants:
                 "categories": parse_categories(categories=opportunity.categories),
                 "applications": opportunity.applications,
                 "success_rate": opportunity.success_rate,
-                "distance": id_to_distance.get(str(opportunity.id)),
+                "distance": opportunity.distance,
             }
         )
+    return matched
 
-    Match.objects.filter(pk=pk).update(proposals=matched)
+
+def _cache(method: str, *args):
+    try:
+        return getattr(caches["matches"], method)(*args)
+    except Exception as exc:  # pylint: disable=too-broad-exception
+        logger.warning(f"Match cache is unavailable ({method}): {exc}")
+        return None
 
 
 def parse_categories(categories: list[str], limit: int = 20) -> list[str]:
     return [" ".join(category.split("_")) for category in categories if len(category) <= limit]
-
-
-@lru_cache(maxsize=1)
-def get_avg_chunks_per_doc() -> int:
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1200, chunk_overlap=150)
-    counts = []
-
-    for opp in Opportunity.objects.all().iterator():
-        counts.append(len(splitter.split_text(opp.describe())))
-
-    if not counts:
-        logger.warning("Average chunks per doc: dataset is empty; defaulting to 4")
-        return 4
-
-    return ceil(sum(counts) / len(counts))
@@ -0,0 +1,197 @@
+import datetime
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from opportunity.models import OpportunityChunk
+from opportunity.services.corpus import bump_corpus_version, refresh_corpus_stats
+from opportunity.services.vectorization import vectorize_opportunities
+from opportunity.tests.test_vectorization import _embed, _opportunity
+
+from search.api.serializers import MatchSerializer
+from search.models import Match
+from search.tasks.match import cached_proposals, find_proposals, match_proposals, proposals_key
+
+MODULE = "search.tasks.match"
+LOCAL_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "embeddings": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "embeddings"},
+    "matches": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "matches"},
+}
+PROPOSALS = [{"id": "1", "title": "Grant", "distance": 0.1}]
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TestProposalsKey(TestCase):
+    def test_same_request_same_key(self) -> None:
+        self.assertEqual(proposals_key("summary", True, 3), proposals_key("summary", True, 3))
+
+    def test_key_covers_the_request(self) -> None:
+        key = proposals_key("summary", True, 3)
+
+        self.assertNotEqual(proposals_key("other summary", True, 3), key)
+        self.assertNotEqual(proposals_key("summary", False, 3), key)
+        self.assertNotEqual(proposals_key("summary", True, 5), key)
+        self.assertNotEqual(proposals_key("summary", True, 3, ef_search=200), key)
+        self.assertNotEqual(proposals_key("summary", True, 3, probes=20), key)
+        with override_settings(MATCH_RETRIEVAL="hybrid"):
+            self.assertNotEqual(proposals_key("summary", True, 3), key)
+
+    def test_key_changes_with_the_corpus_and_the_day(self) -> None:
+        key = proposals_key("summary", True, 3)
+
+        with patch(f"{MODULE}.datetime") as today:
+            today.date.today.return_value = datetime.date.today() + datetime.timedelta(days=1)
+            self.assertNotEqual(proposals_key("summary", True, 3), key)
+
+        bump_corpus_version()
+        self.assertNotEqual(proposals_key("summary", True, 3), key)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+@patch(f"{MODULE}.find_proposals", return_value=PROPOSALS)
+class TestMatchProposals(TestCase):
+    def setUp(self):
+        caches["matches"].clear()
+
+    def test_proposals_are_cached(self, find) -> None:
+        first, second = Match.objects.create(), Match.objects.create()
+
+        self.assertIsNone(cached_proposals("summary"))
+        match_proposals(first.pk, "summary")
+        match_proposals(second.pk, "summary")
+
+        find.assert_called_once_with(summary="summary", funding=True, unique_grants=3, ef_search=None, probes=None)
+        self.assertEqual(cached_proposals("summary"), PROPOSALS)
+        for match in (first, second):
+            match.refresh_from_db()
+            self.assertEqual(match.proposals, PROPOSALS)
+
+    def test_scan_parameters_are_passed_on(self, find) -> None:
+        match_proposals(Match.objects.create().pk, "summary", ef_search=200, probes=20)
+
+        find.assert_called_once_with(summary="summary", funding=True, unique_grants=3, ef_search=200, probes=20)
+        self.assertEqual(cached_proposals("summary", ef_search=200, probes=20), PROPOSALS)
+        self.assertIsNone(cached_proposals("summary"))
+
+    def test_new_corpus_version_misses(self, find) -> None:
+        match_proposals(Match.objects.create().pk, "summary")
+
+        bump_corpus_version()
+
+        self.assertIsNone(cached_proposals("summary"))
+        match_proposals(Match.objects.create().pk, "summary")
+        self.assertEqual(find.call_count, 2)
+
+    def test_edited_and_deleted_grants_miss(self, find) -> None:
+        opportunity = _opportunity()
+        OpportunityChunk.objects.create(
+            id="00000000-0000-0000-0000-000000000001",
+            opportunity=opportunity,
+            index=0,
+            text="chunk",
+            embedding=[1.0] * settings.EMBEDDING_DIMENSIONS,
+            **{field: getattr(opportunity, field) for field in OpportunityChunk.FILTER_FIELDS},
+        )
+        match_proposals(Match.objects.create().pk, "summary")
+
+        # Saving without changing a filter column keeps the cache
+        opportunity.applications = 12
+        opportunity.save()
+        self.assertEqual(cached_proposals("summary"), PROPOSALS)
+
+        opportunity.closed = datetime.date.today() - datetime.timedelta(days=1)
+        opportunity.save()
+        self.assertIsNone(cached_proposals("summary"))
+
+        match_proposals(Match.objects.create().pk, "summary")
+        opportunity.delete()
+        self.assertIsNone(cached_proposals("summary"))
+
+    def test_unavailable_cache_is_skipped(self, find) -> None:
+        cache = MagicMock()
+        cache.get.side_effect = cache.set.side_effect = ConnectionError("Redis is down")
+        match = Match.objects.create()
+
+        with patch(f"{MODULE}.caches", {"matches": cache}):
+            match_proposals(match.pk, "summary")
+            self.assertIsNone(cached_proposals("summary"))
+
+        match.refresh_from_db()
+        self.assertEqual(match.proposals, PROPOSALS)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class TestFindProposals(TestCase):
+    def setUp(self):
+        splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=0)
+        self.opportunities = [_opportunity() for _ in range(3)]
+        self.closed = _opportunity(closed=datetime.date.today() - datetime.timedelta(days=1))
+        vectorize_opportunities(
+            [*self.opportunities, self.closed],
+            splitter=splitter,
+            embed=lambda texts: [_embed(text) for text in texts],
+        )
+        refresh_corpus_stats()
+        backend = MagicMock()
+        backend.embed_query.side_effect = _embed
+        patcher = patch(f"{MODULE}.embeddings", return_value=backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_open_grants_are_proposed(self) -> None:
+        summary = OpportunityChunk.objects.filter(opportunity=self.opportunities[1]).order_by("index").first().text
+        closed = OpportunityChunk.objects.filter(opportunity=self.closed).order_by("index").first().text
+
+        for retrieval in ("vector", "adaptive"):
+            with self.subTest(retrieval=retrieval), override_settings(MATCH_RETRIEVAL=retrieval):
+                proposals = find_proposals(summary=summary, funding=True, unique_grants=3)
+                self.assertEqual(proposals[0]["id"], str(self.opportunities[1].id))
+                self.assertAlmostEqual(proposals[0]["distance"], 0.0)
+                self.assertCountEqual([p["id"] for p in proposals], [str(o.id) for o in self.opportunities])
+
+                proposals = find_proposals(summary=closed, funding=True, unique_grants=3)
+                self.assertNotIn(str(self.closed.id), [p["id"] for p in proposals])
+
+    def test_scan_parameters_reach_the_retrieval(self) -> None:
+        for retrieval, function in (
+            ("vector", "diverse_opportunities"),
+            ("adaptive", "adaptive_opportunities"),
+            ("hybrid", "hybrid_opportunities"),
+        ):
+            with (
+                self.subTest(retrieval=retrieval),
+                override_settings(MATCH_RETRIEVAL=retrieval),
+                patch(f"{MODULE}.{function}", return_value=[]) as search,
+            ):
+                find_proposals(summary="summary", funding=True, unique_grants=3, ef_search=200, probes=20)
+                self.assertEqual(search.call_args.kwargs["ef_search"], 200)
+                self.assertEqual(search.call_args.kwargs["probes"], 20)
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+@patch("search.api.serializers.match_proposals")
+class TestMatchSerializer(TestCase):
+    def setUp(self):
+        caches["matches"].clear()
+
+    def _create(self) -> Match:
+        serializer = MatchSerializer(data={"summary": "summary", "funding": True, "limit": 3})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_cache_hit_is_filled_at_once(self, match_proposals) -> None:
+        caches["matches"].set(proposals_key("summary", True, 3), PROPOSALS)
+
+        match = self._create()
+
+        self.assertEqual(Match.objects.get(pk=match.pk).proposals, PROPOSALS)
+        match_proposals.delay.assert_not_called()
+
+    def test_cache_miss_is_queued(self, match_proposals) -> None:
+        match = self._create()
+
+        self.assertEqual(match.proposals, [])
+        match_proposals.delay.assert_called_once_with(match.pk, "summary", True, 3)
@@ -0,0 +1,271 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from langchain_core.embeddings import Embeddings
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from utils.models import CachedEmbedding
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_MARKERS = ("429", "resource exhausted", "resource_exhausted", "quota", "rate limit")
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """Whether ``exc``, or any exception it was raised from, is an API rate-limit or quota error."""
+    while exc is not None:
+        if getattr(exc, "code", None) == 429 or getattr(exc, "status_code", None) == 429:
+            return True
+        if any(marker in str(exc).lower() for marker in RATE_LIMIT_MARKERS):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class EmbeddingPipeline:
+    """Embed texts in concurrent batches, shrinking them on rate-limit errors."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 100,
+        concurrency: int = 4,
+        min_batch_size: int = 1,
+        max_retries: int = 8,
+        backoff: float = 2.0,
+    ) -> None:
+        self.embeddings = embeddings
+        self.max_batch_size = max(batch_size, 1)
+        self.min_batch_size = max(min(min_batch_size, self.max_batch_size), 1)
+        self.batch_size = self.max_batch_size
+        self.concurrency = max(concurrency, 1)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._step = max(self.max_batch_size // 10, 1)
+        self._failures = 0
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        vectors: list[list[float] | None] = [None] * len(texts)
+        retries: deque[tuple[int, int]] = deque()
+        running: dict[Future, tuple[int, int]] = {}
+        position = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while position < len(texts) or retries or running:
+                while len(running) < self.concurrency and (retries or position < len(texts)):
+                    if retries:
+                        start, end = retries.popleft()
+                        if end - start > self.batch_size:
+                            retries.appendleft((start + self.batch_size, end))
+                            end = start + self.batch_size
+                    else:
+                        start, end = position, min(position + self.batch_size, len(texts))
+                        position = end
+                    future = executor.submit(self.embeddings.embed_documents, texts[start:end])
+                    running[future] = (start, end)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end = running.pop(future)
+                    try:
+                        vectors[start:end] = future.result()
+                    except Exception as exc:  # pylint: disable=too-broad-exception
+                        if not is_rate_limited(exc):
+                            raise
+                        self._rate_limited(exc)
+                        retries.append((start, end))
+                    else:
+                        self._succeeded()
+
+        return vectors
+
+    def _rate_limited(self, exc: Exception) -> None:
+        self._failures += 1
+        if self._failures > self.max_retries:
+            raise exc
+
+        # Halved on every rate-limit error and grown back step by step, a long run settles at the quota's rate
+        self.batch_size = max(self.batch_size // 2, self.min_batch_size)
+        delay = self.backoff * 2 ** (self._failures - 1)
+        logger.warning(f"Rate limited, retrying in {delay:.1f}s with batches of {self.batch_size}")
+        time.sleep(delay)
+
+    def _succeeded(self) -> None:
+        self._failures = 0
+        self.batch_size = min(self.batch_size + self._step, self.max_batch_size)
+
+
+class QueryEmbeddingCache:
+    """Query embeddings in an in-process LRU in front of the shared Django cache ``alias``."""
+
+    def __init__(self, alias: str = "embeddings", max_entries: int = 1024, timeout: int = 7 * 24 * 60 * 60) -> None:
+        self.alias = alias
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._local: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_embed(self, model: str, text: str, embed: Callable[[str], list[float]]) -> list[float]:
+        key = f"query-embedding:{model}:{hashlib.sha256(text.encode()).hexdigest()}"
+        with self._lock:
+            if key in self._local:
+                self._local.move_to_end(key)
+                return list(self._local[key])
+
+        vector = self._shared("get", key)
+        if vector is None:
+            vector = [float(value) for value in embed(text)]
+            self._shared("set", key, vector, self.timeout)
+
+        with self._lock:
+            self._local[key] = vector
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+        return list(vector)
+
+    def _shared(self, method: str, *args):
+        try:
+            return getattr(caches[self.alias], method)(*args)
+        except Exception as exc:  # pylint: disable=too-broad-exception
+            logger.warning(f"Query embedding cache {self.alias!r} is unavailable ({method}): {exc}")
+            return None
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings stored in the ``CachedEmbedding`` table, so unchanged texts are never embedded twice."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model: str,
+        max_entries: int = 1_000_000,
+        queries: QueryEmbeddingCache | None = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.model = model
+        self.max_entries = max_entries
+        self.queries = queries
+        self._inserted = 0
+
+    def embed_documents(
+        self, texts: list[str], embed: Callable[[list[str]], list[list[float]]] | None = None
+    ) -> list[list[float]]:
+        """Embed ``texts``, sending only cache misses to ``embed`` (the wrapped model by default)."""
+        digests = [hashlib.sha256(text.encode()).hexdigest() for text in texts]
+        cached = dict(
+            CachedEmbedding.objects.filter(model=self.model, digest__in=set(digests)).values_list("digest", "embedding")
+        )
+
+        missing = {digest: text for digest, text in zip(digests, texts) if digest not in cached}
+        if missing:
+            vectors = (embed or self.embeddings.embed_documents)(list(missing.values()))
+            cached.update(zip(missing, vectors))
+            CachedEmbedding.objects.bulk_create(
+                [CachedEmbedding(model=self.model, digest=digest, embedding=cached[digest]) for digest in missing],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            self._inserted += len(missing)
+            if self._inserted >= max(self.max_entries // 100, 1):
+                self.evict()
+
+        return [list(map(float, cached[digest])) for digest in digests]
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.queries is None:
+            return self.embeddings.embed_query(text)
+        return self.queries.get_or_embed(self.model, text, embed=self.embeddings.embed_query)
+
+    def evict(self) -> int:
+        """Delete the oldest entries beyond ``max_entries``. Returns the number of deleted entries."""
+        self._inserted = 0
+        table = CachedEmbedding._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id < (SELECT id FROM {table} ORDER BY id DESC OFFSET %s LIMIT 1)",
+                [self.max_entries - 1],
+            )
+            deleted = cursor.rowcount
+
+        if deleted:
+            logger.info(f"Evicted {deleted} cached embeddings")
+        return deleted
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic local embeddings from hashed word and character n-grams, for tests and offline runs."""
+
+    def __init__(
+        self,
+        dimensions: int = 768,
+        n_features: int = 2**18,
+        projections: int = 4,
+        idf: np.ndarray | None = None,
+        seed: int = 0,
+    ) -> None:
+        rng = np.random.default_rng(seed)
+        self.dimensions = dimensions
+        self.n_features = n_features
+        self._buckets = rng.integers(0, dimensions, size=(n_features, projections))
+        self._signs = rng.choice(np.array([-1.0, 1.0]), size=(n_features, projections))
+        self.idf = np.ones(n_features) if idf is None else np.asarray(idf, dtype=float)
+        if self.idf.shape != (n_features,):
+            raise ValueError(f"Expected {n_features} IDF weights, got {self.idf.shape}")
+
+    @property
+    def model(self) -> str:
+        # Cached vectors depend on the IDF weights as well as on the dimensions
+        digest = hashlib.sha256(self.idf.tobytes()).hexdigest()[:12]
+        return f"hashing-tfidf-{self.dimensions}-{digest}"
+
+    def features(self, text: str) -> np.ndarray:
+        words = re.findall(r"\w+", text.lower())
+        grams = [*words, *(f"{first} {second}" for first, second in zip(words, words[1:]))]
+        for word in words:
+            bounded = f"<{word}>"
+            grams.extend(f"#{bounded[i : i + 3]}" for i in range(len(bounded) - 2))
+
+        hashes = (int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "little") for gram in grams)
+        return np.fromiter(hashes, dtype=np.uint64, count=len(grams)) % np.uint64(self.n_features)
+
+    def fit(self, texts: list[str]) -> "HashingEmbeddings":
+        """Learn smoothed IDF weights from ``texts``, e.g. every ``describe()`` of the corpus."""
+        frequencies = np.zeros(self.n_features)
+        for text in texts:
+            frequencies[np.unique(self.features(text))] += 1
+        self.idf = np.log((1 + len(texts)) / (1 + frequencies)) + 1
+        return self
+
+    def save(self, path: str) -> None:
+        np.save(path, self.idf)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        features, counts = np.unique(self.features(text), return_counts=True)
+        weights = (1 + np.log(counts)) * self.idf[features]
+
+        vector = np.zeros(self.dimensions)
+        np.add.at(vector, self._buckets[features].ravel(), (self._signs[features] * weights[:, None]).ravel())
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+def gemini_backend() -> Embeddings:
+    return GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=settings.GEMINI_API_KEY)
+
+
+def hashing_backend() -> Embeddings:
+    idf = np.load(settings.EMBEDDING_HASHING_IDF) if settings.EMBEDDING_HASHING_IDF else None
+    return HashingEmbeddings(dimensions=settings.EMBEDDING_DIMENSIONS, idf=idf)
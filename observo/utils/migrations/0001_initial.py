@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 13:05
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        ("opportunity", "0001_initial"),  # Creates the vector extension
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CachedEmbedding",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model", models.CharField(help_text="Embedding model that produced the vector.", max_length=255)),
+                ("digest", models.CharField(help_text="SHA-256 of the embedded text.", max_length=64)),
+                ("embedding", pgvector.django.vector.VectorField()),
+                ("created_at", models.DateTimeField(auto_now_add=True, verbose_name="Created At")),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("model", "digest"), name="unique_cached_embedding")],
+            },
+        ),
+    ]
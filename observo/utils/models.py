@@ -1,4 +1,5 @@
 from django.db import models
+from pgvector.django import VectorField
 
 
 class TimestampedModel(models.Model):
@@ -7,3 +8,16 @@ class TimestampedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class CachedEmbedding(models.Model):
+    model = models.CharField(max_length=255, help_text="Embedding model that produced the vector.")
+    digest = models.CharField(max_length=64, help_text="SHA-256 of the embedded text.")
+    embedding = VectorField()
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=("model", "digest"), name="unique_cached_embedding")]
+
+    def __str__(self) -> str:
+        return f"{self.model}: {self.digest}"
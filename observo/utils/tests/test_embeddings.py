@@ -0,0 +1,251 @@
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+from ddt import data, ddt, unpack
+from django.core.cache import caches
+from django.test import TestCase as DatabaseTestCase
+from langchain_core.embeddings import Embeddings
+
+from utils.embeddings import (
+    CachedEmbeddings,
+    EmbeddingPipeline,
+    HashingEmbeddings,
+    QueryEmbeddingCache,
+    is_rate_limited,
+)
+from utils.models import CachedEmbedding
+
+MODULE = "utils.embeddings"
+
+
+class RateLimitError(Exception):
+    code = 429
+
+
+class FakeEmbeddings(Embeddings):
+    """Embeds a text as its length; rejects the first ``limited`` calls and any batch above ``quota`` texts."""
+
+    def __init__(self, limited: int = 0, quota: int | None = None) -> None:
+        self.limited = limited
+        self.quota = quota
+        self.batches: list[int] = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            self.batches.append(len(texts))
+            if self.limited > 0 or (self.quota is not None and len(texts) > self.quota):
+                self.limited -= 1
+                raise RuntimeError("Error embedding content") from RateLimitError("Resource has been exhausted")
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(len(text))]
+
+
+@ddt
+@patch(f"{MODULE}.time.sleep")
+class TestEmbeddingPipeline(TestCase):
+    def setUp(self):
+        self.texts = ["x" * length for length in range(1, 251)]
+
+    @unpack
+    @data((100, 1), (100, 4), (7, 3), (500, 2))
+    def test_vectors_keep_input_order(self, batch_size: int, concurrency: int, sleep) -> None:
+        embeddings = FakeEmbeddings()
+
+        vectors = EmbeddingPipeline(embeddings, batch_size=batch_size, concurrency=concurrency).embed(self.texts)
+
+        self.assertEqual(vectors, [[float(len(text))] for text in self.texts])
+        self.assertLessEqual(max(embeddings.batches), batch_size)
+        sleep.assert_not_called()
+
+    def test_batch_shrinks_on_rate_limit_and_grows_back(self, sleep) -> None:
+        embeddings = FakeEmbeddings(limited=2)
+        pipeline = EmbeddingPipeline(embeddings, batch_size=40, concurrency=1)
+
+        vectors = pipeline.embed(self.texts)
+
+        self.assertEqual(vectors, [[float(len(text))] for text in self.texts])
+        self.assertEqual(embeddings.batches[:3], [40, 20, 10])
+        self.assertEqual(pipeline.batch_size, 40)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_batch_settles_below_quota(self, sleep) -> None:
+        embeddings = FakeEmbeddings(quota=25)
+        pipeline = EmbeddingPipeline(embeddings, batch_size=100, concurrency=2)
+
+        vectors = pipeline.embed(self.texts)
+
+        self.assertEqual(vectors, [[float(len(text))] for text in self.texts])
+        self.assertLessEqual(pipeline.batch_size, 100)
+
+    def test_gives_up_after_max_retries(self, sleep) -> None:
+        pipeline = EmbeddingPipeline(FakeEmbeddings(limited=100), batch_size=10, concurrency=1, max_retries=3)
+
+        with self.assertRaises(RuntimeError):
+            pipeline.embed(self.texts)
+        self.assertEqual(sleep.call_count, 3)
+
+    def test_other_errors_are_raised(self, sleep) -> None:
+        class Broken(FakeEmbeddings):
+            def embed_documents(self, texts):
+                raise ValueError("invalid input")
+
+        with self.assertRaises(ValueError):
+            EmbeddingPipeline(Broken(), batch_size=10).embed(self.texts)
+        sleep.assert_not_called()
+
+
+@ddt
+class TestIsRateLimited(TestCase):
+    @unpack
+    @data(
+        (RateLimitError("slow down"), True),
+        (RuntimeError("429 Resource has been exhausted (e.g. check quota)."), True),
+        (ValueError("invalid input"), False),
+    )
+    def test_is_rate_limited(self, exc: Exception, expected: bool) -> None:
+        self.assertEqual(is_rate_limited(exc), expected)
+
+
+class TestCachedEmbeddings(DatabaseTestCase):
+    def test_only_misses_are_embedded(self) -> None:
+        embeddings = FakeEmbeddings()
+        cache = CachedEmbeddings(embeddings, model="fake")
+
+        first = cache.embed_documents(["a", "bb", "a"])
+        second = cache.embed_documents(["bb", "ccc"])
+
+        self.assertEqual(first, [[1.0], [2.0], [1.0]])
+        self.assertEqual(second, [[2.0], [3.0]])
+        self.assertEqual(embeddings.batches, [2, 1])
+        self.assertEqual(CachedEmbedding.objects.count(), 3)
+
+    def test_entries_are_scoped_by_model(self) -> None:
+        embeddings = FakeEmbeddings()
+
+        CachedEmbeddings(embeddings, model="one").embed_documents(["a"])
+        CachedEmbeddings(embeddings, model="two").embed_documents(["a"])
+
+        self.assertEqual(embeddings.batches, [1, 1])
+
+    def test_misses_go_through_custom_embed(self) -> None:
+        embeddings = FakeEmbeddings()
+        pipeline = EmbeddingPipeline(embeddings, batch_size=2)
+
+        vectors = CachedEmbeddings(FakeEmbeddings(), model="fake").embed_documents(["a", "bb", "ccc"], pipeline.embed)
+
+        self.assertEqual(vectors, [[1.0], [2.0], [3.0]])
+        self.assertEqual(sorted(embeddings.batches), [1, 2])
+
+    def test_oldest_entries_are_evicted(self) -> None:
+        cache = CachedEmbeddings(FakeEmbeddings(), model="fake", max_entries=3)
+
+        for text in ["a", "bb", "ccc", "dddd", "eeeee"]:
+            cache.embed_documents([text])
+
+        self.assertEqual(CachedEmbedding.objects.count(), 3)
+        self.assertEqual(cache.embed_documents(["ccc", "dddd", "eeeee"]), [[3.0], [4.0], [5.0]])
+        self.assertEqual(cache.embeddings.batches, [1, 1, 1, 1, 1])
+
+
+class TestQueryEmbeddingCache(TestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.calls: list[str] = []
+
+    def _embed(self, text: str) -> list[float]:
+        self.calls.append(text)
+        return [float(len(text))]
+
+    def test_local_tier(self) -> None:
+        cache = QueryEmbeddingCache(alias="default")
+
+        vectors = [cache.get_or_embed("model", "summary", embed=self._embed) for _ in range(3)]
+
+        self.assertEqual(vectors, [[7.0]] * 3)
+        self.assertEqual(self.calls, ["summary"])
+
+    def test_shared_tier_serves_other_processes(self) -> None:
+        QueryEmbeddingCache(alias="default").get_or_embed("model", "summary", embed=self._embed)
+
+        vector = QueryEmbeddingCache(alias="default").get_or_embed("model", "summary", embed=self._embed)
+
+        self.assertEqual(vector, [7.0])
+        self.assertEqual(self.calls, ["summary"])
+
+    def test_keys_include_the_model(self) -> None:
+        cache = QueryEmbeddingCache(alias="default")
+
+        cache.get_or_embed("model", "summary", embed=self._embed)
+        cache.get_or_embed("other", "summary", embed=self._embed)
+
+        self.assertEqual(self.calls, ["summary", "summary"])
+
+    def test_least_recently_used_entries_are_dropped(self) -> None:
+        cache = QueryEmbeddingCache(alias="default", max_entries=2)
+
+        for text in ("a", "b", "a", "c"):
+            cache.get_or_embed("model", text, embed=self._embed)
+
+        self.assertEqual(len(cache._local), 2)
+        self.assertEqual(self.calls, ["a", "b", "c"])
+
+    def test_unavailable_shared_tier_falls_back_to_embedding(self) -> None:
+        cache = QueryEmbeddingCache(alias="default")
+
+        with patch.object(caches["default"], "get", side_effect=ConnectionError("refused")):
+            vector = cache.get_or_embed("model", "summary", embed=self._embed)
+
+        self.assertEqual(vector, [7.0])
+        self.assertEqual(self.calls, ["summary"])
+
+    def test_cached_embeddings_use_it_for_queries(self) -> None:
+        embeddings = FakeEmbeddings()
+        cached = CachedEmbeddings(embeddings, model="fake", queries=QueryEmbeddingCache(alias="default"))
+
+        with patch.object(embeddings, "embed_query", wraps=embeddings.embed_query) as embed_query:
+            self.assertEqual(cached.embed_query("summary"), cached.embed_query("summary"))
+
+        embed_query.assert_called_once_with("summary")
+
+
+@ddt
+class TestHashingEmbeddings(TestCase):
+    def setUp(self):
+        self.embeddings = HashingEmbeddings(dimensions=64, n_features=2**12)
+
+    def test_vectors_are_deterministic_and_normalized(self) -> None:
+        text = "Research grants for community health centers"
+
+        vector = self.embeddings.embed_query(text)
+
+        self.assertEqual(len(vector), 64)
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0)
+        self.assertEqual(HashingEmbeddings(dimensions=64, n_features=2**12).embed_query(text), vector)
+        self.assertEqual(self.embeddings.embed_documents([text, text]), [vector, vector])
+
+    @unpack
+    @data(
+        ("rural health clinic funding", "funding for rural health clinics", "deep sea marine biology expedition"),
+        ("NSF CAREER award", "the NSF CAREER award program", "Department of Agriculture loans"),
+    )
+    def test_lexical_overlap_is_closer(self, query: str, similar: str, unrelated: str) -> None:
+        vector, close, far = (np.array(self.embeddings.embed_query(text)) for text in (query, similar, unrelated))
+
+        self.assertGreater(vector @ close, vector @ far)
+
+    def test_fit_downweights_common_terms(self) -> None:
+        corpus = [f"grant program {word}" for word in ("health", "energy", "education", "housing")]
+        fitted = HashingEmbeddings(dimensions=64, n_features=2**12).fit(corpus)
+
+        common, rare = fitted.features("grant"), fitted.features("health")
+
+        self.assertLess(fitted.idf[common].mean(), fitted.idf[rare].mean())
+        self.assertNotEqual(fitted.model, self.embeddings.model)
+
+    def test_empty_text(self) -> None:
+        self.assertEqual(self.embeddings.embed_query(""), [0.0] * 64)
@@ -0,0 +1,125 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import faker
+import numpy as np
+from ddt import data, ddt, unpack
+from django.db import connection
+from django.test import TransactionTestCase
+from langchain_core.vectorstores.utils import maximal_marginal_relevance as langchain_mmr
+
+from utils.vector_db import (
+    PRECISIONS,
+    chunk_id,
+    maximal_marginal_relevance,
+    search_params,
+    supports_iterative_scan,
+    vector_literal,
+)
+
+fake = faker.Faker()
+
+
+@ddt
+class TestChunkId(TestCase):
+    def setUp(self):
+        self.opportunity_id = fake.uuid4()
+
+    def test_chunk_id_is_deterministic(self) -> None:
+        self.assertEqual(chunk_id(self.opportunity_id, 0, "text"), chunk_id(self.opportunity_id, 0, "text"))
+
+    @unpack
+    @data(
+        ({"index": 1}, "index"),
+        ({"text": "other text"}, "text"),
+        ({"opportunity_id": "other"}, "opportunity"),
+    )
+    def test_chunk_id_changes(self, overrides: dict, _: str) -> None:
+        values = {"opportunity_id": self.opportunity_id, "index": 0, "text": "text"}
+
+        self.assertNotEqual(chunk_id(**values), chunk_id(**{**values, **overrides}))
+
+
+class TestVectorLiteral(TestCase):
+    def test_vector_literal(self) -> None:
+        self.assertEqual(vector_literal([1, 0.5, -2.25]), "[1.0,0.5,-2.25]")
+
+
+@ddt
+class TestPrecision(TestCase):
+    @unpack
+    @data(
+        ("full", "embedding <=> %s::vector"),
+        ("half", "(embedding)::halfvec(768) <=> (%s::vector)::halfvec(768)"),
+        ("binary", "binary_quantize(embedding)::bit(768) <~> binary_quantize(%s::vector)::bit(768)"),
+    )
+    def test_distance(self, precision: str, expected: str) -> None:
+        self.assertEqual(PRECISIONS[precision].distance("embedding", "%s::vector"), expected)
+
+
+@ddt
+class TestMaximalMarginalRelevance(TestCase):
+    def test_near_duplicates_are_pushed_back(self) -> None:
+        query = [1.0, 0.0]
+        embeddings = [[1.0, 0.1], [1.0, 0.11], [0.7, -0.7]]
+
+        self.assertEqual(list(maximal_marginal_relevance(query, embeddings, lambda_mult=0.3)), [0, 2, 1])
+        self.assertEqual(list(maximal_marginal_relevance(query, embeddings, lambda_mult=1.0)), [0, 1, 2])
+
+    @data(0.0, 0.3, 0.5, 0.9)
+    def test_matches_langchain(self, lambda_mult: float) -> None:
+        rng = np.random.default_rng(0)
+        query, embeddings = rng.normal(size=32), rng.normal(size=(50, 32))
+
+        order = maximal_marginal_relevance(query, embeddings, lambda_mult=lambda_mult)
+
+        expected = langchain_mmr(query, embeddings, lambda_mult=lambda_mult, k=10)
+        self.assertEqual([next(order) for _ in range(10)], expected)
+
+    def test_empty(self) -> None:
+        self.assertEqual(list(maximal_marginal_relevance([1.0, 0.0], [])), [])
+
+
+class TestSearchParams(TransactionTestCase):
+    def test_parameters_are_set_for_the_transaction(self) -> None:
+        with search_params(ef_search=200, probes=10), connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('hnsw.ef_search'), current_setting('ivfflat.probes')")
+            self.assertEqual(cursor.fetchone(), ("200", "10"))
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('hnsw.ef_search', true)")
+            self.assertNotEqual(cursor.fetchone()[0], "200")
+
+    def test_iterative_scan_is_set_for_the_transaction(self) -> None:
+        if not supports_iterative_scan():
+            self.skipTest("pgvector 0.8 or later is required")
+
+        with search_params(iterative_scan="strict_order"), connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('hnsw.iterative_scan'), current_setting('ivfflat.iterative_scan')")
+            self.assertEqual(cursor.fetchone(), ("strict_order", "off"))
+
+        with search_params(iterative_scan="relaxed_order"), connection.cursor() as cursor:
+            cursor.execute("SELECT current_setting('hnsw.iterative_scan'), current_setting('ivfflat.iterative_scan')")
+            self.assertEqual(cursor.fetchone(), ("relaxed_order", "relaxed_order"))
+
+    def test_iterative_scan_is_skipped_before_pgvector_0_8(self) -> None:
+        with (
+            patch("utils.vector_db.supports_iterative_scan", return_value=False),
+            search_params(iterative_scan="strict_order"),
+            connection.cursor() as cursor,
+        ):
+            cursor.execute("SELECT current_setting('hnsw.iterative_scan', true)")
+            self.assertNotEqual(cursor.fetchone()[0], "strict_order")
+
+    def test_pgvector_version_is_read_once(self) -> None:
+        supports_iterative_scan.cache_clear()
+        self.addCleanup(supports_iterative_scan.cache_clear)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            (version,) = cursor.fetchone()
+        expected = tuple(int(part) for part in version.split(".")[:2]) >= (0, 8)
+
+        self.assertEqual(supports_iterative_scan(), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(supports_iterative_scan(), expected)
@@ -1,23 +1,131 @@
+import hashlib
+import logging
+import uuid
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
 from functools import lru_cache
 
+import numpy as np
 from django.conf import settings
-from langchain_community.vectorstores import PGVector
-from langchain_core.vectorstores import VectorStoreRetriever
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from utils.embeddings import CachedEmbeddings, QueryEmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+CHUNK_NAMESPACE = uuid.UUID("6f1c0f3e-8a53-4f0e-9b1a-2d6c5c1e7a40")
+SEARCH_PARAMETERS = {"ef_search": "hnsw.ef_search", "probes": "ivfflat.probes"}
+# Largest hnsw.ef_search pgvector accepts
+MAX_EF_SEARCH = 1000
+# Modes of pgvector's iterative index scans per index type (IVFFlat has no strict ordering)
+ITERATIVE_SCANS = {
+    "hnsw.iterative_scan": ("off", "relaxed_order", "strict_order"),
+    "ivfflat.iterative_scan": ("off", "relaxed_order"),
+}
+
+
+@dataclass(frozen=True)
+class Precision:
+    """How vectors are compared at a given precision: an expression wrapping a vector, its distance and opclass."""
+
+    template: str
+    operator: str
+    opclass: str
+
+    def expression(self, vector: str) -> str:
+        return self.template.format(vector=vector, dimensions=settings.EMBEDDING_DIMENSIONS)
+
+    def distance(self, column: str, query: str) -> str:
+        """SQL distance between ``column`` and ``query``, in the form an index on ``expression(column)`` serves."""
+        return f"{self.expression(column)} {self.operator} {self.expression(query)}"
+
+
+PRECISIONS = {
+    "full": Precision("{vector}", "<=>", "vector_cosine_ops"),
+    "half": Precision("({vector})::halfvec({dimensions})", "<=>", "halfvec_cosine_ops"),
+    "binary": Precision("binary_quantize({vector})::bit({dimensions})", "<~>", "bit_hamming_ops"),
+}
 
 
 @lru_cache(maxsize=1)
-def store() -> PGVector:
-    return PGVector(
-        connection_string=settings.DATABASE_URL,
-        collection_name="opportunities",
-        embedding_function=GoogleGenerativeAIEmbeddings(
-            model="models/text-embedding-004",
-            google_api_key=settings.GEMINI_API_KEY,
+def embeddings() -> CachedEmbeddings:
+    """The ``EMBEDDING_BACKEND`` behind the document and query embedding caches."""
+    backend = import_string(settings.EMBEDDING_BACKEND)()
+    return CachedEmbeddings(
+        embeddings=backend,
+        model=getattr(backend, "model", settings.EMBEDDING_BACKEND),
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        queries=QueryEmbeddingCache(
+            alias="embeddings",
+            max_entries=settings.QUERY_EMBEDDING_CACHE_SIZE,
+            timeout=settings.QUERY_EMBEDDING_CACHE_TIMEOUT,
         ),
-        use_jsonb=True,
     )
 
 
-def retriever_topk(k: int = 10, _filter: dict | None = None) -> VectorStoreRetriever:
-    return store().as_retriever(search_type="similarity", search_kwargs={"k": k, "filter": (_filter or {})})
+@contextmanager
+def search_params(
+    ef_search: int | None = None, probes: int | None = None, iterative_scan: str | None = None
+) -> Iterator[None]:
+    """Run the block in a transaction whose vector index scans use the given parameters."""
+    values = {"ef_search": ef_search, "probes": probes}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for name, value in values.items():
+            if value:
+                cursor.execute(f"SET LOCAL {SEARCH_PARAMETERS[name]} = {int(value)}")
+        # Older pgvector versions reject the parameters, so the scans simply stop at ef_search/probes rows there
+        if iterative_scan and iterative_scan != "off" and supports_iterative_scan():
+            for parameter, modes in ITERATIVE_SCANS.items():
+                if iterative_scan in modes:
+                    cursor.execute(f"SET LOCAL {parameter} = {iterative_scan}")
+        yield
+
+
+@lru_cache(maxsize=1)
+def supports_iterative_scan() -> bool:
+    """Whether the installed pgvector extension (0.8+) has iterative index scans; checked once per process."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+
+    version = tuple(int(part) for part in row[0].split(".")[:2]) if row else ()
+    if version < (0, 8):
+        logger.warning(f"Iterative index scans need pgvector 0.8 or later, found {row[0] if row else 'none'}")
+    return version >= (0, 8)
+
+
+def vector_literal(values: Sequence[float]) -> str:
+    """Text form of a vector, to be cast with ``::vector`` in raw SQL."""
+    return "[" + ",".join(str(float(value)) for value in values) + "]"
+
+
+def chunk_id(opportunity_id: str, index: int, text: str) -> str:
+    """Deterministic id of the ``index``-th chunk of an opportunity, which changes whenever its text does."""
+    digest = hashlib.sha256(text.encode()).hexdigest()
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{opportunity_id}:{index}:{digest}"))
+
+
+def maximal_marginal_relevance(
+    query: Sequence[float], embeddings: Sequence[Sequence[float]], lambda_mult: float = 0.5
+) -> Iterator[int]:
+    """Indices of ``embeddings`` in maximal marginal relevance order, lazily."""
+    if not len(embeddings):
+        return
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), np.finfo(np.float32).tiny)
+    target = np.asarray(query, dtype=np.float32)
+    target /= max(float(np.linalg.norm(target)), np.finfo(np.float32).tiny)
+
+    relevance = vectors @ target
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    for step in range(len(vectors)):
+        # The most relevant one always comes first
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy if step else relevance
+        index = int(np.argmax(np.where(available, scores, -np.inf)))
+        available[index] = False
+        similarity = vectors @ vectors[index]
+        redundancy = similarity if step == 0 else np.maximum(redundancy, similarity)
+        yield index